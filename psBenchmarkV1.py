@@ -0,0 +1,247 @@
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import platform
+import tempfile
+import contextlib
+import multiprocessing
+import typer
+from concurrent.futures import ProcessPoolExecutor
+from colorama import Fore, Style
+from datetime import datetime
+
+app = typer.Typer()
+
+BENCHMARK_VERSION = 1
+PHASES = ("scan", "save", "read", "compare")
+# Every MUTATION_STRIDE-th entry differs between the two manifests of the compare phase
+MUTATION_STRIDE = 100
+
+def generate_tree(root: str, file_count: int, mean_size: int = 16384, distribution: str = "lognormal",
+                  depth: int = 3, fanout: int = 8, hardlink_ratio: float = 0.0, seed: int = 0) -> dict:
+    """Create a reproducible synthetic tree under root and return its file, distinct byte and hardlink counts.
+
+    Files are spread over directories fanout wide and depth deep. Sizes are all mean_size ("fixed")
+    or drawn from a lognormal distribution with that mean. A hardlink_ratio fraction of the files are
+    hardlinks to files created earlier instead of new content.
+    """
+    rng = random.Random(seed)
+    directories = [root]
+    for level in range(depth):
+        directories = [os.path.join(parent, f"d{level}_{index}") for parent in directories for index in range(fanout)]
+    created = []
+    total_bytes = 0
+    hardlinks = 0
+    for index in range(file_count):
+        directory = directories[index % len(directories)]
+        os.makedirs(directory, exist_ok=True)
+        file_path = os.path.join(directory, f"f{index}.bin")
+        if created and rng.random() < hardlink_ratio:
+            os.link(rng.choice(created), file_path)
+            hardlinks += 1
+        else:
+            if distribution == "fixed":
+                size = mean_size
+            else:
+                # Lognormal with sigma 1 has mean exp(mu + 1/2)
+                size = int(rng.lognormvariate(0, 1) * mean_size / 1.6487)
+            with open(file_path, 'wb') as f:
+                f.write(rng.randbytes(size))
+            created.append(file_path)
+            # The scanner reads every inode once, so hardlinks add no bytes to read
+            total_bytes += size
+    return {"files": file_count, "bytes": total_bytes, "hardlinks": hardlinks}
+
+def drop_file_cache(root: str) -> None:
+    """Evict every file under root from the page cache so the next read comes from storage."""
+    if not hasattr(os, "posix_fadvise"):
+        return
+    for directory, _, names in os.walk(root):
+        for name in names:
+            fd = os.open(os.path.join(directory, name), os.O_RDONLY)
+            try:
+                os.fdatasync(fd)
+                os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+            finally:
+                os.close(fd)
+
+def _peak_rss_kb() -> int:
+    """Return the peak resident set size of this process in KiB."""
+    try:
+        import resource
+    except ImportError:
+        return 0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOS reports bytes, Linux KiB
+    return peak // 1024 if sys.platform == "darwin" else peak
+
+def _run_phase(phase: str, tree: str, manifest: str, other_manifest: str, workers: int) -> dict:
+    """Time one phase in the current process, with its output silenced, and return its measurements."""
+    import psScannerV1
+    import psValidatorV1
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull), contextlib.redirect_stderr(devnull):
+        hashes = psValidatorV1.read_hash_file(manifest)[0] if phase == "save" else None
+        start_time = time.perf_counter()
+        if phase == "scan":
+            psScannerV1.generate_hashes(tree, workers=workers)
+        elif phase == "save":
+            psScannerV1.save_hashes_to_file(hashes, other_manifest + ".save")
+        elif phase == "read":
+            psValidatorV1.read_hash_file(manifest)
+        elif phase == "compare":
+            psValidatorV1.compare_hashes(manifest, other_manifest, merkle=False)
+        elapsed_time = time.perf_counter() - start_time
+    return {"seconds": elapsed_time, "peak_rss_kb": _peak_rss_kb()}
+
+def _measure(phase: str, tree: str, manifest: str, other_manifest: str, workers: int) -> dict:
+    """Run one phase in a fresh process so its peak RSS is not inflated by earlier phases."""
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as executor:
+        return executor.submit(_run_phase, phase, tree, manifest, other_manifest, workers).result()
+
+def _prepare_manifests(tree: str, work_dir: str, workers: int) -> tuple:
+    """Scan the tree once and write the two manifests used by the read, save and compare phases."""
+    import psScannerV1
+    manifest = os.path.join(work_dir, "baseline.txt")
+    other_manifest = os.path.join(work_dir, "current.txt")
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull), contextlib.redirect_stderr(devnull):
+        hashes = psScannerV1.generate_hashes(tree, workers=workers)
+    psScannerV1.save_hashes_to_file(hashes, manifest)
+    with open(manifest, 'r') as source, open(other_manifest, 'w') as target:
+        for line_num, line in enumerate(source):
+            if line_num % MUTATION_STRIDE == 0:
+                line = "0" * 128 + line[128:]
+            target.write(line)
+    return manifest, other_manifest
+
+def run_benchmarks(scales: list, phases: list, caches: list, workers: int, repeat: int, tree_options: dict) -> list:
+    """Run every phase at every scale and return one result record per measurement."""
+    results = []
+    for scale in scales:
+        work_dir = tempfile.mkdtemp(prefix="psbench_")
+        try:
+            tree = os.path.join(work_dir, "tree")
+            typer.echo(f"{Fore.CYAN}Generating {scale} files under {tree}{Style.RESET_ALL}")
+            tree_stats = generate_tree(tree, scale, **tree_options)
+            manifest, other_manifest = _prepare_manifests(tree, work_dir, workers)
+            for phase in phases:
+                # Only the scan reads the tree; the manifests are always hot
+                for cache in (caches if phase == "scan" else ["warm"]):
+                    for run in range(repeat):
+                        if phase == "scan":
+                            if cache == "cold":
+                                drop_file_cache(tree)
+                            else:
+                                _measure("scan", tree, manifest, other_manifest, workers)
+                        measurement = _measure(phase, tree, manifest, other_manifest, workers)
+                        data_bytes = tree_stats["bytes"] if phase == "scan" else os.path.getsize(manifest)
+                        seconds = max(measurement["seconds"], 1e-9)
+                        result = {
+                            "phase": phase,
+                            "scale": scale,
+                            "cache": cache,
+                            "run": run,
+                            "files": scale,
+                            "bytes": data_bytes,
+                            "seconds": round(measurement["seconds"], 6),
+                            "files_per_second": round(scale / seconds, 1),
+                            "mb_per_second": round(data_bytes / (1024 * 1024) / seconds, 2),
+                            "peak_rss_kb": measurement["peak_rss_kb"],
+                        }
+                        results.append(result)
+                        typer.echo(f"{Fore.BLUE}{phase:>8} {scale:>9} files {cache:>4}: {result['seconds']:.3f}s, "
+                                   f"{result['files_per_second']:.0f} files/s, {result['mb_per_second']:.1f} MB/s, "
+                                   f"peak RSS {result['peak_rss_kb']} KiB{Style.RESET_ALL}")
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+    return results
+
+def _result_key(result: dict) -> tuple:
+    return result["phase"], result["scale"], result["cache"]
+
+def _best_results(results: list) -> dict:
+    """Keep the fastest run of every (phase, scale, cache) combination."""
+    best = {}
+    for result in results:
+        key = _result_key(result)
+        if key not in best or result["seconds"] < best[key]["seconds"]:
+            best[key] = result
+    return best
+
+@app.command("run")
+def run(
+    output_file: str = typer.Option(..., "-o", "--output", help="JSON file to write the results to"),
+    scales: str = typer.Option("1000,10000", "--scales", help="Comma-separated file counts to benchmark"),
+    phases: str = typer.Option(",".join(PHASES), "--phases", help="Comma-separated phases: scan, save, read, compare"),
+    caches: str = typer.Option("cold,warm", "--caches", help="Page cache states for the scan phase: cold, warm"),
+    workers: int = typer.Option(os.cpu_count() or 1, "-w", "--workers", help="Number of parallel hashing workers"),
+    repeat: int = typer.Option(3, "--repeat", help="Runs per measurement; comparisons use the fastest"),
+    mean_size: int = typer.Option(16384, "--mean-size", help="Mean file size in bytes"),
+    distribution: str = typer.Option("lognormal", "--distribution", help="File size distribution: fixed or lognormal"),
+    depth: int = typer.Option(3, "--depth", help="Directory depth of the synthetic tree"),
+    fanout: int = typer.Option(8, "--fanout", help="Subdirectories per directory"),
+    hardlink_ratio: float = typer.Option(0.0, "--hardlinks", help="Fraction (0-1) of files created as hardlinks"),
+    seed: int = typer.Option(0, "--seed", help="Random seed for the synthetic tree"),
+) -> None:
+    """Benchmark scanner and validator throughput on synthetic trees and save the results as JSON."""
+    phase_list = [phase.strip() for phase in phases.split(",") if phase.strip()]
+    cache_list = [cache.strip() for cache in caches.split(",") if cache.strip()]
+    if set(phase_list) - set(PHASES) or set(cache_list) - {"cold", "warm"} or distribution not in ("fixed", "lognormal"):
+        typer.echo(f"{Fore.RED}Error: Unknown phase, cache state or distribution{Style.RESET_ALL}")
+        raise typer.Exit(code=1)
+    if "cold" in cache_list and not hasattr(os, "posix_fadvise"):
+        typer.echo(f"{Fore.YELLOW}Warning: posix_fadvise is unavailable, cold runs cannot evict the page cache{Style.RESET_ALL}")
+
+    tree_options = {"mean_size": mean_size, "distribution": distribution, "depth": depth, "fanout": fanout,
+                    "hardlink_ratio": hardlink_ratio, "seed": seed}
+    results = run_benchmarks([int(scale) for scale in scales.split(",")], phase_list, cache_list, workers, repeat, tree_options)
+    report = {
+        "benchmark_version": BENCHMARK_VERSION,
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "workers": workers,
+        "tree": tree_options,
+        "results": results,
+    }
+    with open(output_file, 'w') as f:
+        json.dump(report, f, indent=2)
+    typer.echo(f"{Fore.GREEN}Benchmark results saved to {output_file}{Style.RESET_ALL}")
+
+@app.command("compare")
+def compare(
+    old_file: str = typer.Option(..., "-o", "--old", help="Results JSON of the reference run"),
+    new_file: str = typer.Option(..., "-n", "--new", help="Results JSON of the run to check"),
+    threshold: float = typer.Option(10.0, "--threshold", help="Slowdown in percent reported as a regression"),
+) -> None:
+    """Compare two benchmark result files and exit non-zero if any measurement regressed."""
+    with open(old_file, 'r') as f:
+        old_report = json.load(f)
+    with open(new_file, 'r') as f:
+        new_report = json.load(f)
+    if old_report.get("tree") != new_report.get("tree"):
+        typer.echo(f"{Fore.YELLOW}Warning: The runs used different synthetic trees{Style.RESET_ALL}")
+
+    old_best = _best_results(old_report["results"])
+    new_best = _best_results(new_report["results"])
+    regressions = 0
+    for key in sorted(set(old_best) & set(new_best)):
+        old_seconds = old_best[key]["seconds"]
+        new_seconds = new_best[key]["seconds"]
+        change = (new_seconds - old_seconds) / max(old_seconds, 1e-9) * 100
+        colour = Fore.RED if change > threshold else Fore.GREEN if change < -threshold else Fore.BLUE
+        regressions += change > threshold
+        phase, scale, cache = key
+        typer.echo(f"{colour}{phase:>8} {scale:>9} files {cache:>4}: {old_seconds:.3f}s -> {new_seconds:.3f}s "
+                   f"({change:+.1f}%), peak RSS {old_best[key]['peak_rss_kb']} -> {new_best[key]['peak_rss_kb']} KiB{Style.RESET_ALL}")
+
+    if regressions:
+        typer.echo(f"{Fore.RED}{regressions} measurement(s) regressed by more than {threshold:.0f}%{Style.RESET_ALL}")
+        raise typer.Exit(code=1)
+    typer.echo(f"{Fore.GREEN}No regressions beyond {threshold:.0f}%{Style.RESET_ALL}")
+
+if __name__ == "__main__":
+    app()
@@ -0,0 +1,379 @@
+import os
+import mmap
+import struct
+import hashlib
+
+try:
+    import xxhash
+except ImportError:
+    xxhash = None
+
+# Hash algorithms available to the scanner. Only the cryptographic ones protect against deliberate tampering,
+# the others are fast pre-checks. xxhash is optional and only offered when it is installed.
+DEFAULT_ALGORITHM = "sha512"
+CRYPTOGRAPHIC_ALGORITHMS = {
+    "sha512": hashlib.sha512,
+    "sha256": hashlib.sha256,
+    "blake2b": hashlib.blake2b,
+}
+HASH_ALGORITHMS = dict(CRYPTOGRAPHIC_ALGORITHMS)
+if xxhash is not None:
+    HASH_ALGORITHMS["xxh64"] = xxhash.xxh64
+    HASH_ALGORITHMS["xxh3_128"] = xxhash.xxh3_128
+# Suffix of the fast-hash sidecar, a text manifest of the fast algorithm, written by two-tier scans
+FAST_SUFFIX = ".fast"
+# Text manifests of any other algorithm than DEFAULT_ALGORITHM start with this header line
+ALGORITHM_HEADER = "# algorithm: "
+
+def new_hasher(algorithm: str = DEFAULT_ALGORITHM):
+    """Return a fresh hash object for one of HASH_ALGORITHMS."""
+    return HASH_ALGORITHMS[algorithm]()
+
+def algorithm_header(algorithm: str) -> str:
+    """Return the header line that records algorithm in a text manifest, empty for the default."""
+    return "" if algorithm == DEFAULT_ALGORITHM else f"{ALGORITHM_HEADER}{algorithm}\n"
+
+# Binary manifest layout:
+#   header    magic, version, digest size, algorithm/root lengths, entry count, index and string table offsets
+#   algorithm name and scan root, UTF-8
+#   index     one record per file sorted by path: raw digest, then offset/length of its directory and name
+#   strings   deduplicated directory and file name strings referenced by the index
+MAGIC = b"PSM1"
+VERSION = 1
+HEADER = struct.Struct("<4sBBBxIQQQ")
+# Paths are stored with the same escaping os.fsencode uses, so any name the walker returns round-trips
+PATH_ENCODING = "utf-8"
+PATH_ERRORS = "surrogateescape"
+
+def is_binary_manifest(file_path: str) -> bool:
+    """Return True if the file starts with the binary manifest magic."""
+    try:
+        with open(file_path, 'rb') as f:
+            return f.read(len(MAGIC)) == MAGIC
+    except OSError:
+        return False
+
+def manifest_algorithm(file_path: str) -> str:
+    """Return the hash algorithm recorded in a text or binary manifest."""
+    if is_binary_manifest(file_path):
+        with BinaryManifest(file_path) as manifest:
+            return manifest.algorithm
+    with open(file_path, 'r', errors='replace') as f:
+        first_line = f.readline()
+    if first_line.startswith(ALGORITHM_HEADER):
+        return first_line[len(ALGORITHM_HEADER):].strip()
+    return DEFAULT_ALGORITHM
+
+def _record_struct(digest_size: int) -> struct.Struct:
+    """Return the index record layout for digests of digest_size bytes."""
+    return struct.Struct(f"<{digest_size}sQIQI")
+
+def _split_path(file_path: str) -> tuple:
+    """Split a path into its directory (with trailing separator) and name, so both can be deduplicated."""
+    split_at = max(file_path.rfind("/"), file_path.rfind(os.sep)) + 1
+    return file_path[:split_at], file_path[split_at:]
+
+def write_binary_manifest(entries, output_file: str, algorithm: str = DEFAULT_ALGORITHM, root: str = "") -> int:
+    """Write (path, hex digest) entries sorted by path to a binary manifest and return the number written.
+
+    Raises ValueError if the entries are not strictly sorted or a digest does not match the algorithm.
+    """
+    if algorithm not in HASH_ALGORITHMS:
+        raise ValueError(f"Unsupported hash algorithm {algorithm}")
+    digest_size = new_hasher(algorithm).digest_size
+    record = _record_struct(digest_size)
+    algorithm_bytes = algorithm.encode(PATH_ENCODING)
+    root_bytes = root.encode(PATH_ENCODING, PATH_ERRORS)
+    strings = {}
+    table = bytearray()
+
+    def intern(text: str) -> tuple:
+        encoded = text.encode(PATH_ENCODING, PATH_ERRORS)
+        reference = strings.get(encoded)
+        if reference is None:
+            reference = (len(table), len(encoded))
+            table.extend(encoded)
+            strings[encoded] = reference
+        return reference
+
+    count = 0
+    previous_path = None
+    with open(output_file, 'wb') as f:
+        # Reserve the header and fill it in once the counts and offsets are known
+        f.write(HEADER.pack(MAGIC, VERSION, digest_size, len(algorithm_bytes), len(root_bytes), 0, 0, 0))
+        f.write(algorithm_bytes)
+        f.write(root_bytes)
+        index_offset = f.tell()
+        for file_path, file_hash in entries:
+            if previous_path is not None and file_path <= previous_path:
+                raise ValueError(f"Entries are not sorted by path at {file_path}")
+            digest = bytes.fromhex(file_hash)
+            if len(digest) != digest_size:
+                raise ValueError(f"Hash for {file_path} is not a {algorithm} digest")
+            directory, name = _split_path(file_path)
+            f.write(record.pack(digest, *intern(directory), *intern(name)))
+            previous_path = file_path
+            count += 1
+        strings_offset = f.tell()
+        f.write(table)
+        f.seek(0)
+        f.write(HEADER.pack(MAGIC, VERSION, digest_size, len(algorithm_bytes), len(root_bytes),
+                            count, index_offset, strings_offset))
+    return count
+
+class BinaryManifest:
+    """Memory-mapped, read-only view of a binary manifest supporting iteration and path lookups."""
+
+    def __init__(self, file_path: str):
+        self.file_path = file_path
+        self._file = open(file_path, 'rb')
+        try:
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            self._file.close()
+            raise ValueError(f"{file_path} is not a binary manifest")
+        if len(self._map) < HEADER.size or self._map[:len(MAGIC)] != MAGIC:
+            self.close()
+            raise ValueError(f"{file_path} is not a binary manifest")
+        (_, version, self.digest_size, algorithm_length, root_length,
+         self.count, self._index_offset, self._strings_offset) = HEADER.unpack_from(self._map)
+        if version != VERSION:
+            self.close()
+            raise ValueError(f"{file_path} uses unsupported manifest version {version}")
+        position = HEADER.size
+        self.algorithm = self._map[position:position + algorithm_length].decode(PATH_ENCODING)
+        position += algorithm_length
+        self.root = self._map[position:position + root_length].decode(PATH_ENCODING, PATH_ERRORS)
+        self._record = _record_struct(self.digest_size)
+
+    def __len__(self) -> int:
+        return self.count
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self) -> None:
+        if getattr(self, "_map", None) is not None:
+            self._map.close()
+            self._map = None
+        self._file.close()
+
+    def _string(self, offset: int, length: int) -> str:
+        start = self._strings_offset + offset
+        return self._map[start:start + length].decode(PATH_ENCODING, PATH_ERRORS)
+
+    def path(self, index: int) -> str:
+        """Return the path of the entry at index."""
+        _, directory_offset, directory_length, name_offset, name_length = self._record.unpack_from(
+            self._map, self._index_offset + index * self._record.size)
+        return self._string(directory_offset, directory_length) + self._string(name_offset, name_length)
+
+    def entry(self, index: int) -> tuple:
+        """Return (path, hex digest) for the entry at index."""
+        digest, directory_offset, directory_length, name_offset, name_length = self._record.unpack_from(
+            self._map, self._index_offset + index * self._record.size)
+        return self._string(directory_offset, directory_length) + self._string(name_offset, name_length), digest.hex()
+
+    def __iter__(self):
+        for index in range(self.count):
+            yield self.entry(index)
+
+    def lower_bound(self, file_path: str, low: int = 0) -> int:
+        """Return the index of the first entry at or after low whose path is not less than file_path."""
+        high = self.count
+        while low < high:
+            middle = (low + high) // 2
+            if self.path(middle) < file_path:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def lookup(self, file_path: str):
+        """Return the hex digest recorded for file_path, or None, by binary search over the sorted index."""
+        index = self.lower_bound(file_path)
+        if index < self.count:
+            found_path, file_hash = self.entry(index)
+            if found_path == file_path:
+                return file_hash
+        return None
+
+    def iter_directories(self, directories: set):
+        """Yield (index, path, hex digest) for the entries directly inside the given Merkle directories.
+
+        Subtrees of directories outside the set are stepped over by binary search instead of being read.
+        Every ancestor of a wanted directory must be in the set too, as changed_directories guarantees.
+        """
+        index = 0
+        while index < self.count:
+            file_path, file_hash = self.entry(index)
+            directory = _split_path(file_path)[0]
+            if merkle_directory(file_path) in directories:
+                yield index, file_path, file_hash
+                index += 1
+                continue
+            # Step over the shallowest ancestor that is not wanted, with everything below it
+            position = 0
+            while True:
+                position = min(found for found in (directory.find("/", position), directory.find(os.sep, position))
+                               if found >= 0) + 1
+                ancestor = directory[:position]
+                if merkle_directory(ancestor) not in directories:
+                    break
+            # Paths below ancestor sort before ancestor with its trailing separator bumped to the next character
+            index = self.lower_bound(ancestor[:-1] + chr(ord(ancestor[-1]) + 1), index + 1)
+
+    @property
+    def record_size(self) -> int:
+        """Size in bytes of one index record."""
+        return self._record.size
+
+# Per-directory Merkle digests are kept in a DIGEST:directory sidecar next to the manifest.
+# Directories are keyed with a trailing separator, and the top of the tree as ROOT_DIRECTORY.
+MERKLE_SUFFIX = ".merkle"
+ROOT_DIRECTORY = "."
+# First line of a Merkle sidecar, followed by SIZE:MTIME_NS:FILES:DIGEST of the manifest it belongs to
+MERKLE_HEADER = "# manifest: "
+MANIFEST_DIGEST_CHUNK = 1 << 20
+
+def _directory_parts(directory: str) -> tuple:
+    """Split a directory with trailing separator into (absolute, components)."""
+    normalized = directory.replace(os.sep, "/")
+    absolute = normalized.startswith("/")
+    return absolute, tuple(part for part in normalized.split("/") if part)
+
+def _directory_key(absolute: bool, parts: tuple) -> str:
+    """Return the key of the directory with the given components."""
+    if not parts:
+        return ROOT_DIRECTORY
+    return (os.sep if absolute else "") + os.sep.join(parts) + os.sep
+
+def merkle_directory(file_path: str) -> str:
+    """Return the Merkle key of the directory holding file_path."""
+    return _directory_key(*_directory_parts(_split_path(file_path)[0]))
+
+def parent_directory(directory: str) -> str:
+    """Return the Merkle key of the parent of a directory key."""
+    absolute, parts = _directory_parts(directory)
+    return _directory_key(absolute, parts[:-1])
+
+class MerkleBuilder:
+    """Compute one digest per directory from (path, hash) entries fed in path order.
+
+    A directory digest covers the names and digests of its files and subdirectories, so two
+    directories have the same digest exactly when everything below them is identical. Paths sorted
+    as strings keep every directory's entries contiguous, so only the open directories are held.
+    """
+
+    def __init__(self, algorithm: str = DEFAULT_ALGORITHM):
+        self.algorithm = algorithm
+        self.absolute = False
+        self.digests = {}
+        self._stack = []
+
+    def add(self, file_path: str, file_hash: str) -> None:
+        directory, name = _split_path(file_path)
+        self.absolute, parts = _directory_parts(directory)
+        # Close directories that are not ancestors of this file, then open the ones leading to it
+        while self._stack and self._stack[-1][0] != parts[:len(self._stack[-1][0])]:
+            self._close()
+        if not self._stack:
+            self._stack.append(((), new_hasher(self.algorithm)))
+        while len(self._stack[-1][0]) < len(parts):
+            self._stack.append((parts[:len(self._stack[-1][0]) + 1], new_hasher(self.algorithm)))
+        self._stack[-1][1].update(f"f\0{name}\0{file_hash}\n".encode(PATH_ENCODING, PATH_ERRORS))
+
+    def _close(self) -> None:
+        parts, hasher = self._stack.pop()
+        digest = hasher.hexdigest()
+        self.digests[_directory_key(self.absolute, parts)] = digest
+        if self._stack:
+            self._stack[-1][1].update(f"d\0{parts[-1]}\0{digest}\n".encode(PATH_ENCODING, PATH_ERRORS))
+
+    def finish(self) -> dict:
+        """Close every open directory and return the directory -> digest mapping."""
+        while self._stack:
+            self._close()
+        return self.digests
+
+def manifest_digest(file_path: str) -> str:
+    """Return the BLAKE2b digest of a manifest file's bytes, which ties a Merkle sidecar to it."""
+    hasher = hashlib.blake2b()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(MANIFEST_DIGEST_CHUNK), b''):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+def write_merkle(digests: dict, output_file: str, manifest_file: str, file_count: int) -> None:
+    """Write directory digests to a Merkle sidecar sorted by directory.
+
+    A header line records the size, modification time, number of entries and digest of manifest_file,
+    so the sidecar is only trusted next to the manifest it was computed from.
+    """
+    stat_result = os.stat(manifest_file)
+    binding = f"{stat_result.st_size}:{stat_result.st_mtime_ns}:{file_count}:{manifest_digest(manifest_file)}"
+    with open(output_file, 'w', encoding=PATH_ENCODING, errors=PATH_ERRORS) as f:
+        f.write(f"{MERKLE_HEADER}{binding}\n")
+        for directory, digest in sorted(digests.items()):
+            f.write(f"{digest}:{directory}\n")
+
+def read_merkle(file_path: str) -> tuple:
+    """Read a Merkle sidecar into (directory -> digest mapping, (size, mtime_ns, entry count, digest) of its manifest).
+
+    The second item is None for sidecars written before the header was recorded.
+    """
+    digests = {}
+    binding = None
+    with open(file_path, 'r', encoding=PATH_ENCODING, errors=PATH_ERRORS) as f:
+        for line in f:
+            if line.startswith(MERKLE_HEADER):
+                size, mtime_ns, file_count, digest = line[len(MERKLE_HEADER):].strip().split(':')
+                binding = (int(size), int(mtime_ns), int(file_count), digest)
+                continue
+            digest, separator, directory = line.rstrip('\n').partition(':')
+            if separator and digest and directory:
+                digests[directory] = digest
+    return digests, binding
+
+def merkle_matches(binding: tuple, manifest_file: str) -> bool:
+    """Tell whether a Merkle sidecar binding read by read_merkle still describes manifest_file.
+
+    An unchanged size and modification time settle it with one stat call; only a manifest that was
+    copied or touched since is hashed in full to find out whether its content is still the same.
+    """
+    if binding is None:
+        return False
+    stat_result = os.stat(manifest_file)
+    if stat_result.st_size != binding[0]:
+        return False
+    return stat_result.st_mtime_ns == binding[1] or manifest_digest(manifest_file) == binding[3]
+
+def changed_directories(old_digests: dict, new_digests: dict) -> tuple:
+    """Descend from the root into directories whose digests differ.
+
+    Returns (changed, visited): the set of directories whose digest differs or that exist on one
+    side only, and the number of directories examined. Subtrees with equal digests are never entered.
+    """
+    if old_digests.get(ROOT_DIRECTORY) is not None and old_digests.get(ROOT_DIRECTORY) == new_digests.get(ROOT_DIRECTORY):
+        return set(), 1
+
+    children = {}
+    for directory in set(old_digests).union(new_digests):
+        if directory != ROOT_DIRECTORY:
+            children.setdefault(parent_directory(directory), []).append(directory)
+
+    changed = set()
+    visited = 0
+    pending = [ROOT_DIRECTORY]
+    while pending:
+        directory = pending.pop()
+        visited += 1
+        old_digest = old_digests.get(directory)
+        if old_digest is not None and old_digest == new_digests.get(directory):
+            continue
+        changed.add(directory)
+        pending.extend(children.get(directory, ()))
+    return changed, visited
@@ -0,0 +1,279 @@
+import os
+import sys
+import json
+import time
+import heapq
+import bisect
+import pstats
+import cProfile
+import tempfile
+import contextlib
+import typer
+from colorama import Fore, Style
+
+METRICS_FORMATS = ("prometheus", "json")
+# Upper bounds in seconds of the per-file hashing latency histogram buckets
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0, 60.0)
+# Slowest files kept for the metrics output when --slowest is not given
+DEFAULT_SLOWEST = 10
+PROFILE_LINES = 25
+# Global options that take a value, skipped when looking for the command name of a command line
+GLOBAL_VALUE_OPTIONS = ("--metrics", "--metrics-format", "--profile", "--slowest")
+
+class Metrics:
+    """Phase timings, counters, a per-file hashing latency histogram and the slowest files of one run.
+
+    Phases are timed in the main thread and are exclusive: time spent in a nested phase does not
+    count towards the enclosing one. Time spent in hashing workers is kept apart as worker seconds,
+    summed over all workers. A disabled instance records nothing, so instrumented code can always
+    call it.
+    """
+
+    def __init__(self, tool: str = "", command: str = "", slowest: int = DEFAULT_SLOWEST, enabled: bool = True):
+        self.tool = tool
+        self.command = command
+        self.slowest = slowest
+        self.enabled = enabled
+        self.timestamp = time.time()
+        self.total_seconds = 0.0
+        self.phases = {}
+        self.worker_seconds = {}
+        self.counters = {}
+        self.buckets = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.latency_sum = 0.0
+        self._started = time.perf_counter()
+        self._stack = []
+        # Min-heap of (seconds, path, size), so the fastest of the slowest files is dropped first
+        self._slowest = []
+
+    def _add(self, phase: str, seconds: float) -> None:
+        self.phases[phase] = self.phases.get(phase, 0.0) + seconds
+
+    def start(self, phase: str) -> None:
+        """Start timing phase, pausing the phase that is currently running."""
+        if not self.enabled:
+            return
+        now = time.perf_counter()
+        if self._stack:
+            self._add(self._stack[-1][0], now - self._stack[-1][1])
+        self._stack.append([phase, now])
+
+    def stop(self) -> None:
+        """Stop timing the current phase and resume the one it interrupted."""
+        if not self.enabled:
+            return
+        now = time.perf_counter()
+        phase, since = self._stack.pop()
+        self._add(phase, now - since)
+        if self._stack:
+            self._stack[-1][1] = now
+
+    @contextlib.contextmanager
+    def phase(self, name: str):
+        """Time the enclosed block as phase name."""
+        self.start(name)
+        try:
+            yield
+        finally:
+            self.stop()
+
+    def timed(self, iterable, phase: str):
+        """Pass the items of iterable through, counting the time spent producing them towards phase."""
+        if not self.enabled:
+            return iterable
+        return self._timed(iterable, phase)
+
+    def _timed(self, iterable, phase: str):
+        iterator = iter(iterable)
+        while True:
+            self.start(phase)
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            finally:
+                self.stop()
+            yield item
+
+    def count(self, name: str, value: int = 1) -> None:
+        """Add value to counter name."""
+        if self.enabled:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def add_worker_time(self, phase: str, seconds: float) -> None:
+        """Add seconds a worker spent in phase."""
+        if self.enabled:
+            self.worker_seconds[phase] = self.worker_seconds.get(phase, 0.0) + seconds
+
+    def observe(self, file_path: str, seconds: float, size: int = 0) -> None:
+        """Record how long a worker took to read and hash one file."""
+        if not self.enabled:
+            return
+        self.buckets[bisect.bisect_left(LATENCY_BUCKETS, seconds)] += 1
+        self.latency_sum += seconds
+        entry = (seconds, file_path, size)
+        if len(self._slowest) < self.slowest:
+            heapq.heappush(self._slowest, entry)
+        elif self._slowest and seconds > self._slowest[0][0]:
+            heapq.heappushpop(self._slowest, entry)
+
+    def slowest_files(self) -> list:
+        """Return the (seconds, path, size) of the slowest files, slowest first."""
+        return sorted(self._slowest, reverse=True)
+
+    def finish(self) -> None:
+        """Record the total run time."""
+        self.total_seconds = time.perf_counter() - self._started
+
+    def to_dict(self) -> dict:
+        cumulative = 0
+        buckets = {}
+        for bound, count in zip(list(LATENCY_BUCKETS) + ["+Inf"], self.buckets):
+            cumulative += count
+            buckets[str(bound)] = cumulative
+        return {
+            "tool": self.tool,
+            "command": self.command,
+            "timestamp": self.timestamp,
+            "total_seconds": round(self.total_seconds, 6),
+            "phases": {phase: round(seconds, 6) for phase, seconds in self.phases.items()},
+            "worker_seconds": {phase: round(seconds, 6) for phase, seconds in self.worker_seconds.items()},
+            "counters": dict(self.counters),
+            "file_hash_seconds": {"buckets": buckets, "sum": round(self.latency_sum, 6), "count": cumulative},
+            "slowest_files": [{"path": file_path, "seconds": round(seconds, 6), "size": size}
+                              for seconds, file_path, size in self.slowest_files()],
+        }
+
+    def to_prometheus(self) -> str:
+        """Render the run in the Prometheus text exposition format, for the node_exporter textfile collector."""
+        prefix = self.tool
+        labels = f'command="{self.command}"'
+        lines = [
+            f"# HELP {prefix}_run_seconds Wall time of the last run.",
+            f"# TYPE {prefix}_run_seconds gauge",
+            f"{prefix}_run_seconds{{{labels}}} {self.total_seconds:.6f}",
+            f"# HELP {prefix}_last_run_timestamp_seconds Unix time the last run started.",
+            f"# TYPE {prefix}_last_run_timestamp_seconds gauge",
+            f"{prefix}_last_run_timestamp_seconds{{{labels}}} {self.timestamp:.3f}",
+            f"# HELP {prefix}_phase_seconds Main thread wall time spent in each phase of the last run.",
+            f"# TYPE {prefix}_phase_seconds gauge",
+        ]
+        lines += [f'{prefix}_phase_seconds{{{labels},phase="{phase}"}} {seconds:.6f}' for phase, seconds in sorted(self.phases.items())]
+        lines += [
+            f"# HELP {prefix}_worker_seconds Time hashing workers spent in each phase of the last run, summed over workers.",
+            f"# TYPE {prefix}_worker_seconds gauge",
+        ]
+        lines += [f'{prefix}_worker_seconds{{{labels},phase="{phase}"}} {seconds:.6f}' for phase, seconds in sorted(self.worker_seconds.items())]
+        for name, value in sorted(self.counters.items()):
+            lines += [f"# TYPE {prefix}_{name} gauge", f"{prefix}_{name}{{{labels}}} {value}"]
+        lines += [
+            f"# HELP {prefix}_file_hash_seconds Time taken to read and hash a single file.",
+            f"# TYPE {prefix}_file_hash_seconds histogram",
+        ]
+        cumulative = 0
+        for bound, count in zip(list(LATENCY_BUCKETS) + ["+Inf"], self.buckets):
+            cumulative += count
+            lines.append(f'{prefix}_file_hash_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+        lines.append(f"{prefix}_file_hash_seconds_sum{{{labels}}} {self.latency_sum:.6f}")
+        lines.append(f"{prefix}_file_hash_seconds_count{{{labels}}} {cumulative}")
+        return "\n".join(lines) + "\n"
+
+    def write(self, output_file: str, metrics_format: str = "prometheus") -> None:
+        """Write the metrics to output_file, replacing it atomically so collectors never see a partial file."""
+        content = self.to_prometheus() if metrics_format == "prometheus" else json.dumps(self.to_dict(), indent=2) + "\n"
+        directory = os.path.dirname(os.path.abspath(output_file))
+        fd, temp_file = tempfile.mkstemp(dir=directory, prefix=".metrics_", suffix=".tmp")
+        try:
+            with os.fdopen(fd, 'w') as f:
+                f.write(content)
+            os.replace(temp_file, output_file)
+        except BaseException:
+            with contextlib.suppress(OSError):
+                os.remove(temp_file)
+            raise
+
+DISABLED_METRICS = Metrics(enabled=False)
+
+def instrument(ctx: typer.Context, tool: str, metrics_file: str = None, metrics_format: str = "prometheus",
+               profile_file: str = None, slowest: int = 0):
+    """Set up metrics and cProfile for the command about to run in ctx, and finish both when it exits.
+
+    Returns the Metrics of the run, or None when neither a metrics file nor the slowest files were
+    asked for. Everything is reported on stderr, so it never mixes with reports written to stdout.
+    """
+    metrics = None
+    if metrics_file or slowest:
+        metrics = Metrics(tool, ctx.invoked_subcommand or "", slowest or DEFAULT_SLOWEST)
+    profiler = None
+    if profile_file:
+        profiler = cProfile.Profile()
+        profiler.enable()
+
+    def finish():
+        if profiler is not None:
+            profiler.disable()
+            try:
+                profiler.dump_stats(profile_file)
+                typer.echo(f"{Fore.CYAN}Profile saved to {profile_file}{Style.RESET_ALL}", err=True)
+            except IOError as e:
+                typer.echo(f"{Fore.YELLOW}Warning: Could not write profile {profile_file}: {str(e)}{Style.RESET_ALL}", err=True)
+            pstats.Stats(profiler, stream=sys.stderr).sort_stats("cumulative").print_stats(PROFILE_LINES)
+        if metrics is None:
+            return
+        metrics.finish()
+        if slowest:
+            typer.echo(f"{Fore.BLUE}Slowest files:{Style.RESET_ALL}", err=True)
+            for seconds, file_path, size in metrics.slowest_files():
+                typer.echo(f"{Fore.BLUE}  {seconds:8.3f}s {size / (1024 * 1024):10.1f} MB  {file_path}{Style.RESET_ALL}", err=True)
+        if metrics_file:
+            try:
+                metrics.write(metrics_file, metrics_format)
+                typer.echo(f"{Fore.CYAN}Metrics saved to {metrics_file}{Style.RESET_ALL}", err=True)
+            except IOError as e:
+                typer.echo(f"{Fore.YELLOW}Warning: Could not write metrics {metrics_file}: {str(e)}{Style.RESET_ALL}", err=True)
+
+    ctx.call_on_close(finish)
+    return metrics
+
+def global_options(tool: str, description: str, error_code: int = 1,
+                   metrics_help: str = "Write phase timings and counters to this file",
+                   slowest_help: str = "List the N files that took longest to hash"):
+    """Build the app callback taking the metrics and profiling options shared by every command of a tool.
+
+    The callback sets up instrument for the command and stores its Metrics in ctx.obj. An unknown
+    metrics format ends the run with error_code.
+    """
+    def options(
+        ctx: typer.Context,
+        metrics_file: str = typer.Option(None, "--metrics", help=metrics_help),
+        metrics_format: str = typer.Option("prometheus", "--metrics-format", help="Metrics file format: prometheus (textfile collector) or json"),
+        profile: str = typer.Option(None, "--profile", help="Profile the run with cProfile and save the stats to this file"),
+        slowest: int = typer.Option(0, "--slowest", help=slowest_help),
+    ) -> None:
+        if metrics_format not in METRICS_FORMATS:
+            typer.echo(f"{Fore.RED}Error: Unknown metrics format {metrics_format}, expected prometheus or json{Style.RESET_ALL}", err=True)
+            raise typer.Exit(code=error_code)
+        ctx.obj = instrument(ctx, tool, metrics_file, metrics_format, profile, slowest)
+
+    options.__doc__ = description
+    return options
+
+def legacy_command_line(app: typer.Typer, argv: list, default_command: str) -> list:
+    """Insert default_command into a command line written before the tool had subcommands.
+
+    Calls such as the original "psScannerV1.py -i DIR -o FILE" name no command and keep working
+    as the default command. Global options in front of the command are skipped over.
+    """
+    commands = {command.name for command in app.registered_commands}
+    index = 0
+    while index < len(argv):
+        arg = argv[index]
+        if arg in GLOBAL_VALUE_OPTIONS:
+            index += 2
+        elif arg.partition("=")[0] in GLOBAL_VALUE_OPTIONS:
+            index += 1
+        elif arg in commands or not arg.startswith("-") or arg in ("--help", "--install-completion", "--show-completion"):
+            return argv
+        else:
+            return argv[:index] + [default_command] + argv[index:]
+    return argv
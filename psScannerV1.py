@@ -1,52 +1,1029 @@
 import os
-import hashlib
 import typer
+import hashlib
 from pathlib import Path
 from tqdm import tqdm
 from colorama import Fore, Style
 from datetime import datetime
 import time
+import random
+import heapq
+import tempfile
+import threading
+import mmap
+import errno
+import select
+import struct
+import sys
+import ctypes
+import ctypes.util
+from collections import ChainMap, OrderedDict
+from typing import List
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+from psManifestV1 import (BinaryManifest, CRYPTOGRAPHIC_ALGORITHMS, DEFAULT_ALGORITHM, FAST_SUFFIX, HASH_ALGORITHMS,
+                          MerkleBuilder, MERKLE_SUFFIX, algorithm_header, is_binary_manifest, manifest_algorithm, new_hasher,
+                          write_binary_manifest, write_merkle)
+from psMetricsV1 import DISABLED_METRICS, global_options, legacy_command_line
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, FIRST_COMPLETED, as_completed, wait
 
 app = typer.Typer()
 
-def generate_hashes(folder_path: str) -> dict:
-    """Generate SHA512 hashes for all files in the specified folder."""
-    hashes = {}
-    # Use Path for more efficient path handling
-    folder_path = Path(folder_path)
+CHUNK_SIZE = 65536
+# Suffix of the metadata sidecar written next to every manifest and read back by --reuse
+METADATA_SUFFIX = ".meta"
+MANIFEST_EXTENSIONS = {"text": ".txt", "binary": ".psm"}
+# Number of files hashed concurrently per worker, and number of manifest lines sorted in memory before spilling to disk
+PENDING_PER_WORKER = 4
+SORT_RUN_SIZE = 1000000
+# Number of walked files grouped by inode and reordered before they are read
+SCHEDULE_BATCH_SIZE = 10000
+# Hardlinked inodes whose digest is kept for links still to come; the oldest are dropped and read again if met
+LINKED_INODES = 100000
+READ_ORDERS = ("walk", "inode", "physical")
+# FIEMAP ioctl (linux/fiemap.h) asking for the first extent of a file
+FS_IOC_FIEMAP = 0xC020660B
+FIEMAP_MAX_OFFSET = 0xFFFFFFFFFFFFFFFF
+_FIEMAP = struct.Struct("=QQIIII")
+_FIEMAP_EXTENT = struct.Struct("=QQQQQIIII")
+# Journal of hashed files kept while a scan runs, so --resume can skip them after an interruption
+CHECKPOINT_SUFFIX = ".checkpoint"
+CHECKPOINT_HEADER = "# checkpoint: "
+CHECKPOINT_INTERVAL = 30.0
+
+# Per-thread read buffers reused across files by the readinto and fadvise backends
+_buffers = threading.local()
+
+def _read_buffer(chunk_size: int) -> memoryview:
+    """Return this thread's preallocated read buffer of chunk_size bytes."""
+    buffer = getattr(_buffers, "view", None)
+    if buffer is None or len(buffer) != chunk_size:
+        buffer = memoryview(bytearray(chunk_size))
+        _buffers.view = buffer
+    return buffer
+
+def _hash_read(hasher, file_path, chunk_size: int) -> None:
+    """Feed a file to hasher with plain buffered reads."""
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            hasher.update(chunk)
+
+def _hash_readinto(hasher, file_path, chunk_size: int) -> None:
+    """Feed a file to hasher by reading into a reused buffer, without allocating per chunk."""
+    buffer = _read_buffer(chunk_size)
+    with open(file_path, 'rb', buffering=0) as f:
+        while True:
+            size = f.readinto(buffer)
+            if not size:
+                break
+            hasher.update(buffer[:size])
+
+def _hash_mmap(hasher, file_path, chunk_size: int) -> None:
+    """Feed a file to hasher straight from a read-only memory map."""
+    with open(file_path, 'rb', buffering=0) as f:
+        # Empty files cannot be mapped and small ones are cheaper to read; a file truncated to empty
+        # after this check makes mmap raise ValueError, which the caller reports like a read error
+        if os.fstat(f.fileno()).st_size < chunk_size:
+            for chunk in iter(lambda: f.read(chunk_size), b""):
+                hasher.update(chunk)
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            if hasattr(mapped, "madvise"):
+                mapped.madvise(mmap.MADV_SEQUENTIAL)
+            hasher.update(mapped)
+
+_libc = None
+
+def _load_libc():
+    """Return libc with mmap, munmap and mincore prototypes declared, or None where it cannot be loaded."""
+    global _libc
+    if _libc is None:
+        try:
+            libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+            libc.mmap.restype = ctypes.c_void_p
+            libc.mmap.argtypes = [ctypes.c_void_p, ctypes.c_size_t, ctypes.c_int, ctypes.c_int, ctypes.c_int, ctypes.c_long]
+            libc.munmap.argtypes = [ctypes.c_void_p, ctypes.c_size_t]
+            libc.mincore.argtypes = [ctypes.c_void_p, ctypes.c_size_t, ctypes.c_void_p]
+            _libc = libc
+        except (OSError, AttributeError):
+            _libc = False
+    return _libc or None
+
+def resident_pages(fd: int, size: int):
+    """Return one byte per page of the first size bytes of a file, odd when that page is in the page cache.
+
+    Returns None where mincore is unavailable. Mapping the file without touching it reads nothing.
+    """
+    libc = _load_libc()
+    if libc is None or size <= 0:
+        return None
+    address = libc.mmap(None, size, mmap.PROT_READ, mmap.MAP_SHARED, fd, 0)
+    if address is None or address == ctypes.c_void_p(-1).value:
+        return None
+    try:
+        vector = (ctypes.c_ubyte * ((size + mmap.PAGESIZE - 1) // mmap.PAGESIZE))()
+        if libc.mincore(address, size, vector) != 0:
+            return None
+        return bytes(vector)
+    finally:
+        libc.munmap(address, size)
+
+# Maps each mincore byte to its residency bit
+_RESIDENT_BIT = bytes(value & 1 for value in range(256))
+
+def non_resident_ranges(resident: bytes) -> list:
+    """Return the (first page, page count) runs of pages that resident_pages reported as not cached."""
+    flags = resident.translate(_RESIDENT_BIT)
+    ranges = []
+    start = flags.find(0)
+    while start >= 0:
+        end = flags.find(1, start)
+        if end < 0:
+            end = len(flags)
+        ranges.append((start, end - start))
+        start = flags.find(0, end)
+    return ranges
+
+def _hash_fadvise(hasher, file_path, chunk_size: int) -> None:
+    """Feed a file to hasher with unbuffered reads, then drop the pages this read brought into the page cache.
+
+    Pages that were cached before, e.g. for a running service, stay cached. Where mincore is
+    unavailable nothing is dropped, since the pages the read brought in cannot be told apart.
+    """
+    if not hasattr(os, "posix_fadvise"):
+        _hash_readinto(hasher, file_path, chunk_size)
+        return
+    buffer = _read_buffer(chunk_size)
+    with open(file_path, 'rb', buffering=0) as f:
+        fd = f.fileno()
+        resident = resident_pages(fd, os.fstat(fd).st_size)
+        os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_SEQUENTIAL)
+        try:
+            while True:
+                size = f.readinto(buffer)
+                if not size:
+                    break
+                hasher.update(buffer[:size])
+        finally:
+            # Keep a full scan from filling the page cache without evicting what others rely on
+            if resident is not None:
+                for first_page, page_count in non_resident_ranges(resident):
+                    os.posix_fadvise(fd, first_page * mmap.PAGESIZE, page_count * mmap.PAGESIZE, os.POSIX_FADV_DONTNEED)
+
+IO_BACKENDS = {
+    "read": _hash_read,
+    "readinto": _hash_readinto,
+    "mmap": _hash_mmap,
+    "fadvise": _hash_fadvise,
+}
+
+class _MultiHasher:
+    """Feed the same data to several hash objects, so one read serves every algorithm."""
+
+    def __init__(self, hashers: list):
+        self.hashers = hashers
+
+    def update(self, data) -> None:
+        for hasher in self.hashers:
+            hasher.update(data)
+
+class _TimedHasher:
+    """Feed data to a hash object, adding the time spent hashing to timing[0] so it can be told apart from reading."""
+
+    def __init__(self, hasher, timing: list):
+        self.hasher = hasher
+        self.timing = timing
+
+    def update(self, data) -> None:
+        started = time.perf_counter()
+        self.hasher.update(data)
+        self.timing[0] += time.perf_counter() - started
+
+def hash_file_digests(file_path, algorithms: tuple, backend: str = "read", chunk_size: int = CHUNK_SIZE,
+                      timing: list = None) -> tuple:
+    """Return the hex digests of a single file for each of algorithms, reading it once.
+
+    With timing, a one-element list, the seconds spent hashing rather than reading are added to it.
+    """
+    hashers = [new_hasher(algorithm) for algorithm in algorithms]
+    hasher = hashers[0] if len(hashers) == 1 else _MultiHasher(hashers)
+    if timing is not None:
+        hasher = _TimedHasher(hasher, timing)
+    IO_BACKENDS[backend](hasher, file_path, chunk_size)
+    return tuple(hasher.hexdigest() for hasher in hashers)
+
+def hash_file(file_path, backend: str = "read", chunk_size: int = CHUNK_SIZE, algorithm: str = DEFAULT_ALGORITHM,
+              timing: list = None) -> str:
+    """Return the hex digest of a single file, read with the given I/O backend."""
+    return hash_file_digests(file_path, (algorithm,), backend, chunk_size, timing)[0]
 
-    # Check if it's a file or directory
-    if folder_path.is_file():
-        files = [folder_path]
+def _hash_task(file_path, backend: str, chunk_size: int, algorithm: str, fast_algorithm: str = None,
+               previous: tuple = None) -> tuple:
+    """Hash one file for iter_hashes and return (hash, fast_hash, (read_seconds, hash_seconds)).
+
+    previous is the (hash, fast_hash) recorded for a file of the same size by an earlier scan. If the
+    fast hash still matches, that hash is reused and the slower algorithm is never run; if it does not,
+    the file is read a second time for the full digest, which costs less than always reading it for both
+    when most changed signatures hide unchanged content. With the mmap backend, page faults happen
+    while hashing and are counted as hashing time.
+    """
+    timing = [0.0]
+    started = time.perf_counter()
+    if fast_algorithm is None:
+        file_hash, fast_hash = hash_file(file_path, backend, chunk_size, algorithm, timing), None
+    elif previous is not None:
+        fast_hash = hash_file(file_path, backend, chunk_size, fast_algorithm, timing)
+        if fast_hash == previous[1]:
+            file_hash = previous[0]
+        else:
+            file_hash = hash_file(file_path, backend, chunk_size, algorithm, timing)
     else:
-        # Collect all files in the folder and subfolders
-        files = list(folder_path.rglob('*'))
-        files = [f for f in files if f.is_file()]
+        file_hash, fast_hash = hash_file_digests(file_path, (algorithm, fast_algorithm), backend, chunk_size, timing)
+    elapsed = time.perf_counter() - started
+    return file_hash, fast_hash, (elapsed - timing[0], timing[0])
+
+def file_signature(stat_result: os.stat_result) -> tuple:
+    """Return the (size, mtime_ns, ctime_ns, inode) signature used to detect unchanged files."""
+    return (stat_result.st_size, stat_result.st_mtime_ns, stat_result.st_ctime_ns, stat_result.st_ino)
+
+def shard_of(name: str, shard_count: int) -> int:
+    """Return the 0-based shard owning the top-level entry called name, the same on every host and run."""
+    digest = hashlib.blake2b(os.fsencode(name), digest_size=8).digest()
+    return int.from_bytes(digest, "big") % shard_count
+
+def parse_shard(text: str) -> tuple:
+    """Parse a K/N shard specification into a 0-based (index, count) pair, raising ValueError if malformed."""
+    index, separator, count = text.partition("/")
+    if not separator:
+        raise ValueError(f"expected K/N, got {text}")
+    index, count = int(index), int(count)
+    if not 1 <= index <= count:
+        raise ValueError(f"shard {index} is not between 1 and {count}")
+    return index - 1, count
 
-    # Generate hashes for each file
-    for file_path in tqdm(files, desc="Generating hashes", unit="file", colour="green"):
+def _child_path(directory: str, name: str) -> str:
+    """Return the path of name inside directory as Path(directory) / name formats it, without a leading "./"."""
+    return name if directory == "." else os.path.join(directory, name)
+
+def walk_files(folder_path: str, shard: tuple = None, metrics=None):
+    """Yield (path, stat_result) for every file under folder_path, streaming directories with os.scandir.
+
+    With shard, a 0-based (index, count) pair, only the top-level entries of folder_path that
+    shard_of assigns to index are walked. With metrics, stat calls are timed as the stat phase and
+    unreadable or skipped entries are counted.
+    """
+    metrics = metrics if metrics is not None else DISABLED_METRICS
+    # Use Path for consistent path formatting with earlier manifests
+    root = str(Path(folder_path))
+    if os.path.isfile(root):
+        if shard is None or shard_of(os.path.basename(root), shard[1]) == shard[0]:
+            yield root, os.stat(root)
+        return
+
+    directories = [root]
+    while directories:
+        directory = directories.pop()
         try:
-            # Read file in chunks to handle large files efficiently
-            hash_sha512 = hashlib.sha512()
-            with open(file_path, 'rb') as f:
-                # Read file in 64KB chunks
-                for chunk in iter(lambda: f.read(65536), b''):
-                    hash_sha512.update(chunk)
-            hashes[str(file_path)] = hash_sha512.hexdigest()
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    if shard is not None and directory == root and shard_of(entry.name, shard[1]) != shard[0]:
+                        continue
+                    entry_path = _child_path(directory, entry.name)
+                    try:
+                        # Like rglob, descend into real directories only but follow symlinks to files
+                        if entry.is_dir(follow_symlinks=False):
+                            directories.append(entry_path)
+                        elif entry.is_file():
+                            metrics.start("stat")
+                            try:
+                                stat_result = entry.stat()
+                            finally:
+                                metrics.stop()
+                            yield entry_path, stat_result
+                        else:
+                            metrics.count("skipped_entries")
+                    except OSError as e:
+                        metrics.count("walk_errors")
+                        typer.echo(f"{Fore.YELLOW}Warning: Could not read file {entry_path}: {str(e)}{Style.RESET_ALL}")
+        except OSError as e:
+            metrics.count("walk_errors")
+            typer.echo(f"{Fore.YELLOW}Warning: Could not read directory {directory}: {str(e)}{Style.RESET_ALL}")
+
+def iter_hashes(folder_path: str, workers: int = 1, pool: str = "thread", cache: dict = None, paranoid: float = 0.0,
+                backend: str = "read", chunk_size: int = CHUNK_SIZE, stats: dict = None,
+                algorithm: str = DEFAULT_ALGORITHM, fast_algorithm: str = None, order: str = "inode",
+                progress: bool = True, shard: tuple = None, metrics=None):
+    """Yield (path, hash, signature, fast_hash) for every file in the specified folder as soon as it is hashed."""
+    metrics = metrics if metrics is not None else DISABLED_METRICS
+    entries = metrics.timed(walk_files(folder_path, shard, metrics), "walk")
+    return hash_entries(entries, workers, pool, cache, paranoid, backend, chunk_size, stats,
+                        algorithm, fast_algorithm, progress, order, metrics)
+
+def hash_entries(entries, workers: int = 1, pool: str = "thread", cache: dict = None, paranoid: float = 0.0,
+                 backend: str = "read", chunk_size: int = CHUNK_SIZE, stats: dict = None,
+                 algorithm: str = DEFAULT_ALGORITHM, fast_algorithm: str = None, progress: bool = True,
+                 order: str = "inode", metrics=None):
+    """Yield (path, hash, signature, fast_hash) for (path, stat_result) entries as soon as each file is hashed.
+
+    Files whose signature matches an entry in cache (path -> (signature, hash, fast_hash)) reuse the
+    cached hash, except for a random paranoid fraction that is rehashed anyway. With fast_algorithm,
+    files whose signature changed but whose size and fast hash did not also keep their cached hash,
+    except for a paranoid fraction of them that gets the full digest.
+    Entries are scheduled in batches: paths sharing an inode are read once, and each batch is read in
+    the given order ("walk", "inode", or "physical" extent order where FIEMAP is available). At most a
+    few files per worker are in flight at any time, so memory does not grow with the size of the tree.
+    When stats is given, it accumulates hashed_files, hashed_bytes, reused_files, fast_reused_files,
+    shared_files and read_errors counters. With metrics, the read and hash time of every file is
+    recorded as worker seconds and in the latency histogram.
+    """
+    cache = cache or {}
+    stats = stats if stats is not None else {}
+    metrics = metrics if metrics is not None else DISABLED_METRICS
+    for counter in ("hashed_files", "hashed_bytes", "reused_files", "fast_reused_files", "shared_files", "read_errors"):
+        stats.setdefault(counter, 0)
+    workers = max(workers, 1)
+    # (result, links not seen yet) of multiply-linked inodes, so hardlinks in later batches are not read again
+    linked = OrderedDict()
+    executor_class = ProcessPoolExecutor if pool == "process" else ThreadPoolExecutor
+    with executor_class(max_workers=workers) as executor, \
+            tqdm(desc="Generating hashes", unit="file", colour="green", disable=not progress) as pbar:
+        pending = {}
+        for batch in _batches(entries, SCHEDULE_BATCH_SIZE):
+            groups = {}
+            for file_path, stat_result in batch:
+                signature = file_signature(stat_result)
+                cached = cache.get(file_path)
+                if cached is not None and cached[0] == signature and random.random() >= paranoid:
+                    pbar.update(1)
+                    stats["reused_files"] += 1
+                    yield file_path, cached[1], signature, cached[2]
+                    continue
+
+                sampled_hash = cached[1] if cached is not None and cached[0] == signature else None
+                # Sampled files always get the full digest, others may settle for a matching fast hash,
+                # except for the same paranoid fraction, since a fast hash can be forged to collide
+                previous = None
+                if fast_algorithm is not None and sampled_hash is None and cached is not None \
+                        and cached[2] is not None and cached[0][0] == signature[0] and random.random() >= paranoid:
+                    previous = (cached[1], cached[2])
+                inode = (stat_result.st_dev, stat_result.st_ino)
+                groups.setdefault(inode, []).append((file_path, signature, sampled_hash, previous, stat_result))
+
+            for group in _schedule(groups, order):
+                leader_stat = group[0][4]
+                link_key = None
+                if leader_stat.st_nlink > 1:
+                    link_key = (leader_stat.st_dev, leader_stat.st_ino, leader_stat.st_size,
+                                leader_stat.st_mtime_ns, leader_stat.st_ctime_ns)
+                    shared = linked.get(link_key)
+                    if shared is not None:
+                        stats["shared_files"] += len(group)
+                        shared[1] -= len(group)
+                        if shared[1] <= 0:
+                            del linked[link_key]
+                        yield from _share_hashes(group, shared[0], pbar, stats)
+                        continue
+                # Hash functions release the GIL, so threads scale for I/O and hashing alike
+                future = executor.submit(_hash_task, group[0][0], backend, chunk_size, algorithm, fast_algorithm, group[0][3])
+                pending[future] = (group, link_key)
+                if len(pending) >= workers * PENDING_PER_WORKER:
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    yield from _collect_hashes(done, pending, pbar, stats, linked, metrics)
+        yield from _collect_hashes(list(pending), pending, pbar, stats, linked, metrics)
+
+def _batches(iterable, size: int):
+    """Yield lists of up to size items from iterable."""
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def physical_offset(file_path: str):
+    """Return the physical byte offset of a file's first extent using FIEMAP, or None where unsupported."""
+    if fcntl is None:
+        return None
+    request = bytearray(_FIEMAP.size + _FIEMAP_EXTENT.size)
+    _FIEMAP.pack_into(request, 0, 0, FIEMAP_MAX_OFFSET, 0, 0, 1, 0)
+    try:
+        fd = os.open(file_path, os.O_RDONLY)
+        try:
+            fcntl.ioctl(fd, FS_IOC_FIEMAP, request)
+        finally:
+            os.close(fd)
+    except OSError:
+        return None
+    if _FIEMAP.unpack_from(request)[3] == 0:
+        return None
+    return _FIEMAP_EXTENT.unpack_from(request, _FIEMAP.size)[1]
+
+def _schedule(groups: dict, order: str) -> list:
+    """Return the hardlink groups of one batch, keyed by (st_dev, st_ino), in the order they should be read."""
+    if order == "walk":
+        return list(groups.values())
+    if order == "physical":
+        offsets = {inode: physical_offset(group[0][0]) for inode, group in groups.items()}
+        # Files without a known extent, e.g. empty or inline ones, follow in inode order
+        return [groups[inode] for inode in sorted(groups, key=lambda inode: (inode[0], offsets[inode] is None,
+                                                                            offsets[inode] or 0, inode[1]))]
+    return [groups[inode] for inode in sorted(groups)]
+
+def _share_hashes(group: list, result: tuple, pbar, stats: dict):
+    """Yield (path, hash, signature, fast_hash) for every path of a hardlink group from one hashing result."""
+    file_hash, fast_hash = result[:2]
+    for file_path, signature, sampled_hash, _, _ in group:
+        pbar.update(1)
+        # A paranoid rehash that disagrees with an unchanged signature means the content changed behind our back
+        if sampled_hash is not None and sampled_hash != file_hash:
+            typer.echo(f"{Fore.RED}Warning: Content of {file_path} changed without a change in size or timestamps{Style.RESET_ALL}")
+        yield file_path, file_hash, signature, fast_hash
+
+def _collect_hashes(futures, pending: dict, pbar, stats: dict, linked: dict, metrics=DISABLED_METRICS):
+    """Yield (path, hash, signature, fast_hash) for finished futures, removing them from pending."""
+    for future in as_completed(futures):
+        group, link_key = pending.pop(future)
+        leader_path, signature, _, previous, leader_stat = group[0]
+        try:
+            result = future.result()
+        except (OSError, ValueError) as e:
+            pbar.update(len(group))
+            stats["read_errors"] += len(group)
+            for file_path, *_ in group:
+                typer.echo(f"{Fore.YELLOW}Warning: Could not read file {file_path}: {str(e)}{Style.RESET_ALL}")
+            continue
+        stats["hashed_files"] += 1
+        stats["hashed_bytes"] += signature[0]
+        stats["shared_files"] += len(group) - 1
+        read_seconds, hash_seconds = result[2]
+        metrics.add_worker_time("read", read_seconds)
+        metrics.add_worker_time("hash", hash_seconds)
+        metrics.observe(leader_path, read_seconds + hash_seconds, signature[0])
+        if previous is not None and previous[1] == result[1]:
+            stats["fast_reused_files"] += 1
+        # Remember the digest until every link has been seen, within a bounded number of inodes
+        if link_key is not None and leader_stat.st_nlink > len(group):
+            linked[link_key] = [result, leader_stat.st_nlink - len(group)]
+            if len(linked) > LINKED_INODES:
+                linked.popitem(last=False)
+        yield from _share_hashes(group, result, pbar, stats)
+
+def generate_hashes(folder_path: str, workers: int = 1, pool: str = "thread", cache: dict = None,
+                    paranoid: float = 0.0, backend: str = "read", chunk_size: int = CHUNK_SIZE,
+                    algorithm: str = DEFAULT_ALGORITHM, order: str = "inode") -> dict:
+    """Generate hashes for all files in the specified folder using a pool of workers."""
+    hashes = iter_hashes(folder_path, workers, pool, cache, paranoid, backend, chunk_size, algorithm=algorithm, order=order)
+    return {file_path: file_hash for file_path, file_hash, *_ in hashes}
+
+def iter_manifest(manifest_file: str):
+    """Yield (path, hash) for every entry of a text or binary manifest, skipping malformed text lines."""
+    if is_binary_manifest(manifest_file):
+        with BinaryManifest(manifest_file) as manifest:
+            yield from manifest
+        return
+    with open(manifest_file, 'r') as f:
+        for line in f:
+            if line.startswith('#'):
+                continue
+            file_hash, sep, file_path = line.rstrip('\n').partition(':')
+            if sep and file_hash and file_path:
+                yield file_path, file_hash
+
+def load_hash_cache(manifest_file: str, algorithm: str = DEFAULT_ALGORITHM, fast_algorithm: str = None) -> dict:
+    """Load a previous manifest and its sidecars into a path -> (signature, hash, fast_hash) cache.
+
+    Nothing is reused from a manifest of another algorithm, and fast hashes only when their sidecar
+    was written with fast_algorithm.
+    """
+    try:
+        previous_algorithm = manifest_algorithm(manifest_file)
+        if previous_algorithm != algorithm:
+            typer.echo(f"{Fore.YELLOW}Warning: Previous manifest {manifest_file} uses {previous_algorithm}, not {algorithm}, every file will be rehashed{Style.RESET_ALL}")
+            return {}
+        cached_hashes = dict(iter_manifest(manifest_file))
+    except (IOError, ValueError) as e:
+        typer.echo(f"{Fore.YELLOW}Warning: Could not read previous manifest {manifest_file}: {str(e)}{Style.RESET_ALL}")
+        return {}
+
+    fast_hashes = {}
+    fast_file = manifest_file + FAST_SUFFIX
+    if fast_algorithm is not None and os.path.exists(fast_file):
+        try:
+            if manifest_algorithm(fast_file) == fast_algorithm:
+                fast_hashes = dict(iter_manifest(fast_file))
         except IOError as e:
-            typer.echo(f"{Fore.YELLOW}Warning: Could not read file {file_path}: {str(e)}{Style.RESET_ALL}")
-    return hashes
+            typer.echo(f"{Fore.YELLOW}Warning: Could not read fast hashes {fast_file}: {str(e)}{Style.RESET_ALL}")
 
-def save_hashes_to_file(hashes: dict, output_file: str) -> None:
-    """Save the generated hashes to a file with format HASH:filename."""
+    cache = {}
     try:
-        with open(output_file, 'w') as f:
-            for file_path, file_hash in sorted(hashes.items()):
-                f.write(f"{file_hash}:{file_path}\n")
+        for file_path, signature in iter_metadata(manifest_file + METADATA_SUFFIX):
+            if file_path in cached_hashes:
+                cache[file_path] = (signature, cached_hashes[file_path], fast_hashes.get(file_path))
     except IOError as e:
-        typer.echo(f"{Fore.RED}Error: Could not write to file {output_file}: {str(e)}{Style.RESET_ALL}")
-        raise typer.TyperExit(code=1)
+        typer.echo(f"{Fore.YELLOW}Warning: Could not read metadata for {manifest_file}, every file will be rehashed: {str(e)}{Style.RESET_ALL}")
+        return {}
+    return cache
+
+def iter_metadata(metadata_file: str):
+    """Yield (path, signature) for every well-formed line of a SIZE:MTIME_NS:CTIME_NS:INODE:filename sidecar."""
+    with open(metadata_file, 'r') as f:
+        for line in f:
+            parts = line.rstrip('\n').split(':', 4)
+            if len(parts) != 5:
+                continue
+            try:
+                signature = tuple(int(value) for value in parts[:4])
+            except ValueError:
+                continue
+            yield parts[4], signature
+
+def iter_manifest_entries(manifest_file: str, fast_algorithm: str = None):
+    """Yield (path, hash, signature, fast_hash) for a sorted manifest, joining its sorted sidecars in lockstep.
+
+    The signature is None when there is no .meta sidecar, and the fast hash when there is no .fast
+    sidecar written with fast_algorithm, or when a sidecar has no line for the path.
+    """
+    metadata_file = manifest_file + METADATA_SUFFIX
+    fast_file = manifest_file + FAST_SUFFIX
+    metadata = iter_metadata(metadata_file) if os.path.exists(metadata_file) else iter(())
+    fast = iter(())
+    if fast_algorithm is not None and os.path.exists(fast_file) and manifest_algorithm(fast_file) == fast_algorithm:
+        fast = iter_manifest(fast_file)
+    next_metadata = next(metadata, None)
+    next_fast = next(fast, None)
+    for file_path, file_hash in iter_manifest(manifest_file):
+        while next_metadata is not None and next_metadata[0] < file_path:
+            next_metadata = next(metadata, None)
+        while next_fast is not None and next_fast[0] < file_path:
+            next_fast = next(fast, None)
+        signature = next_metadata[1] if next_metadata is not None and next_metadata[0] == file_path else None
+        fast_hash = next_fast[1] if next_fast is not None and next_fast[0] == file_path else None
+        yield file_path, file_hash, signature, fast_hash
+
+def _checkpoint_header(algorithm: str, fast_algorithm: str = None) -> str:
+    return f"{CHECKPOINT_HEADER}{algorithm}:{fast_algorithm or ''}\n"
+
+def load_checkpoint(checkpoint_file: str, algorithm: str = DEFAULT_ALGORITHM, fast_algorithm: str = None) -> dict:
+    """Load the journal of an interrupted scan into a path -> (signature, hash, fast_hash) cache.
+
+    Journals of another algorithm are ignored, and so is a line cut short by the interruption.
+    """
+    cache = {}
+    try:
+        with open(checkpoint_file, 'r') as f:
+            if f.readline() != _checkpoint_header(algorithm, fast_algorithm):
+                typer.echo(f"{Fore.YELLOW}Warning: Checkpoint {checkpoint_file} was written with other hash algorithms, starting over{Style.RESET_ALL}")
+                return {}
+            for line in f:
+                if not line.endswith('\n'):
+                    break
+                parts = line[:-1].split(':', 6)
+                if len(parts) != 7:
+                    continue
+                try:
+                    signature = tuple(int(value) for value in parts[:4])
+                except ValueError:
+                    continue
+                cache[parts[6]] = (signature, parts[4], parts[5] or None)
+    except IOError as e:
+        typer.echo(f"{Fore.YELLOW}Warning: Could not read checkpoint {checkpoint_file}, starting over: {str(e)}{Style.RESET_ALL}")
+        return {}
+    return cache
+
+def checkpoint_hashes(hashes, checkpoint_file: str, algorithm: str = DEFAULT_ALGORITHM, fast_algorithm: str = None,
+                      resumed: dict = None, interval: float = CHECKPOINT_INTERVAL):
+    """Pass (path, hash, signature, fast_hash) entries through, appending each one to a checkpoint journal.
+
+    The journal is synced to disk every interval seconds, so an interrupted scan loses at most that
+    much work. With resumed, the cache loaded from the journal, the journal is extended rather than
+    replaced and entries it already holds are not written again.
+    """
+    resumed = resumed or {}
+    with open(checkpoint_file, 'a' if resumed else 'w') as journal:
+        if not resumed:
+            journal.write(_checkpoint_header(algorithm, fast_algorithm))
+        last_sync = time.monotonic()
+        for entry in hashes:
+            file_path, file_hash, signature, fast_hash = entry
+            if signature is not None and resumed.get(file_path) != (signature, file_hash, fast_hash):
+                size, mtime_ns, ctime_ns, inode = signature
+                journal.write(f"{size}:{mtime_ns}:{ctime_ns}:{inode}:{file_hash}:{fast_hash or ''}:{file_path}\n")
+            if time.monotonic() - last_sync >= interval:
+                journal.flush()
+                os.fsync(journal.fileno())
+                last_sync = time.monotonic()
+            yield entry
+
+class SortedRunWriter:
+    """Write lines to a file sorted by path, spilling sorted runs to disk so memory stays bounded."""
+
+    def __init__(self, output_file: str, path_field: int, run_size: int = None, header: str = "", metrics=None):
+        self.output_file = output_file
+        self.metrics = metrics if metrics is not None else DISABLED_METRICS
+        self.header = header
+        self.path_field = path_field
+        self.run_size = run_size or SORT_RUN_SIZE
+        self.buffer = []
+        self.runs = []
+        self.count = 0
+
+    def _key(self, line: str) -> str:
+        return line.rstrip('\n').split(':', self.path_field)[self.path_field]
+
+    def add(self, line: str) -> None:
+        self.buffer.append(line)
+        self.count += 1
+        if len(self.buffer) >= self.run_size:
+            self._spill()
+
+    def _spill(self) -> None:
+        with self.metrics.phase("sort"):
+            self.buffer.sort(key=self._key)
+            run = tempfile.NamedTemporaryFile('w', delete=False, dir=os.path.dirname(os.path.abspath(self.output_file)),
+                                              prefix=".run_", suffix=".tmp")
+            with run:
+                run.writelines(self.buffer)
+            self.runs.append(run.name)
+            self.buffer = []
+
+    def sorted_lines(self):
+        """Yield every line added so far in path order, merging the spilled runs."""
+        if not self.runs:
+            with self.metrics.phase("sort"):
+                self.buffer.sort(key=self._key)
+            yield from self.buffer
+            return
+        if self.buffer:
+            self._spill()
+        run_files = [open(run, 'r') for run in self.runs]
+        try:
+            yield from heapq.merge(*run_files, key=self._key)
+        finally:
+            for run_file in run_files:
+                run_file.close()
+
+    def close(self) -> None:
+        """Merge all runs into the output file and remove them."""
+        try:
+            with open(self.output_file, 'w') as f:
+                f.write(self.header)
+                f.writelines(self.sorted_lines())
+        finally:
+            self.discard()
+
+    def discard(self) -> None:
+        """Remove any spilled runs without writing the output file."""
+        for run in self.runs:
+            try:
+                os.remove(run)
+            except OSError:
+                pass
+        self.runs = []
+        self.buffer = []
+
+def _split_manifest_lines(lines):
+    """Yield (path, hash) from HASH:filename lines."""
+    for line in lines:
+        file_hash, _, file_path = line.rstrip('\n').partition(':')
+        yield file_path, file_hash
+
+def _feed_merkle(lines, merkle):
+    """Pass HASH:filename lines through, adding each one to a MerkleBuilder on the way."""
+    for line in lines:
+        if merkle is not None:
+            file_hash, _, file_path = line.rstrip('\n').partition(':')
+            merkle.add(file_path, file_hash)
+        yield line
+
+def save_hashes_to_file(hashes, output_file: str, metadata_file: str = None, output_format: str = "text",
+                        root: str = "", merkle_file: str = None, algorithm: str = DEFAULT_ALGORITHM,
+                        fast_file: str = None, fast_algorithm: str = None, metrics=None) -> int:
+    """Save hashes to a file with format HASH:filename, sorted by filename, and return the number written.
+
+    hashes is either a path -> hash dict or an iterable of (path, hash, signature, fast_hash) tuples,
+    which is consumed as it is produced. With metadata_file, signatures are also saved to a sidecar
+    with format SIZE:MTIME_NS:CTIME_NS:INODE:filename. With output_format "binary", a binary manifest
+    recording root is written instead of the text format. With merkle_file, per-directory Merkle
+    digests are computed from the sorted stream and saved alongside. With fast_file, fast hashes are
+    saved to a text sidecar in manifest format. Manifests of any algorithm but the default SHA512
+    record it in a header line. With metrics, sorting and writing are timed as phases.
+    """
+    metrics = metrics if metrics is not None else DISABLED_METRICS
+    entries = ((file_path, file_hash, None, None) for file_path, file_hash in hashes.items()) if isinstance(hashes, dict) else hashes
+    manifest = SortedRunWriter(output_file, path_field=1, metrics=metrics)
+    metadata = SortedRunWriter(metadata_file, path_field=4, metrics=metrics) if metadata_file else None
+    fast = SortedRunWriter(fast_file, path_field=1, header=algorithm_header(fast_algorithm), metrics=metrics) if fast_file else None
+    merkle = MerkleBuilder(algorithm) if merkle_file else None
+    try:
+        try:
+            for file_path, file_hash, signature, fast_hash in entries:
+                manifest.add(f"{file_hash}:{file_path}\n")
+                if metadata is not None and signature is not None:
+                    size, mtime_ns, ctime_ns, inode = signature
+                    metadata.add(f"{size}:{mtime_ns}:{ctime_ns}:{inode}:{file_path}\n")
+                if fast is not None and fast_hash is not None:
+                    fast.add(f"{fast_hash}:{file_path}\n")
+            with metrics.phase("write"):
+                sorted_lines = _feed_merkle(manifest.sorted_lines(), merkle)
+                if output_format == "binary":
+                    write_binary_manifest(_split_manifest_lines(sorted_lines), output_file, algorithm, root)
+                else:
+                    with open(output_file, 'w') as f:
+                        f.write(algorithm_header(algorithm))
+                        f.writelines(sorted_lines)
+        except IOError as e:
+            typer.echo(f"{Fore.RED}Error: Could not write to file {output_file}: {str(e)}{Style.RESET_ALL}")
+            raise typer.Exit(code=1)
+
+        with metrics.phase("write"):
+            for sidecar in (metadata, fast):
+                if sidecar is not None:
+                    try:
+                        sidecar.close()
+                    except IOError as e:
+                        typer.echo(f"{Fore.YELLOW}Warning: Could not write metadata file {sidecar.output_file}: {str(e)}{Style.RESET_ALL}")
+            if merkle is not None:
+                try:
+                    write_merkle(merkle.finish(), merkle_file, output_file, manifest.count)
+                except IOError as e:
+                    typer.echo(f"{Fore.YELLOW}Warning: Could not write Merkle file {merkle_file}: {str(e)}{Style.RESET_ALL}")
+    finally:
+        # Spilled runs must not outlive the call, whether it finished, failed or was interrupted
+        for writer in (manifest, metadata, fast):
+            if writer is not None:
+                writer.discard()
+    return manifest.count
+
+def _unique_entries(entries):
+    """Pass path-sorted entries through, dropping repeated paths with a warning."""
+    previous_path = None
+    for entry in entries:
+        if entry[0] == previous_path:
+            typer.echo(f"{Fore.YELLOW}Warning: {entry[0]} is recorded in more than one shard, keeping the first{Style.RESET_ALL}")
+            continue
+        previous_path = entry[0]
+        yield entry
+
+def merge_shards(manifest_files: list, output_file: str, output_format: str = "text", root: str = None,
+                 metrics=None) -> int:
+    """Merge the sorted manifests of a sharded scan, with their sidecars, into one manifest and return its size.
+
+    All shards must use the same algorithm. Metadata and fast-hash sidecars are only merged when every
+    shard has one, written with the same fast algorithm; a Merkle sidecar is always computed. The
+    binary format records root, by default the root of the first binary shard. Raises ValueError if
+    the shards cannot be merged.
+    """
+    algorithms = {manifest_algorithm(manifest_file) for manifest_file in manifest_files}
+    if len(algorithms) != 1:
+        raise ValueError(f"shards use different hash algorithms: {', '.join(sorted(algorithms))}")
+    algorithm = algorithms.pop()
+
+    has_metadata = all(os.path.exists(manifest_file + METADATA_SUFFIX) for manifest_file in manifest_files)
+    fast_algorithm = None
+    if all(os.path.exists(manifest_file + FAST_SUFFIX) for manifest_file in manifest_files):
+        fast_algorithms = {manifest_algorithm(manifest_file + FAST_SUFFIX) for manifest_file in manifest_files}
+        if len(fast_algorithms) == 1:
+            fast_algorithm = fast_algorithms.pop()
+
+    if root is None:
+        root = ""
+        for manifest_file in manifest_files:
+            if is_binary_manifest(manifest_file):
+                with BinaryManifest(manifest_file) as manifest:
+                    root = manifest.root
+                break
+
+    metrics = metrics if metrics is not None else DISABLED_METRICS
+    shards = [iter_manifest_entries(manifest_file, fast_algorithm) for manifest_file in manifest_files]
+    entries = _unique_entries(metrics.timed(heapq.merge(*shards, key=lambda entry: entry[0]), "parse"))
+    return save_hashes_to_file(entries, output_file, output_file + METADATA_SUFFIX if has_metadata else None,
+                               output_format, root=root, merkle_file=output_file + MERKLE_SUFFIX, algorithm=algorithm,
+                               fast_file=output_file + FAST_SUFFIX if fast_algorithm else None,
+                               fast_algorithm=fast_algorithm, metrics=metrics)
+
+# inotify(7) event masks used by the watch command
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+WATCH_MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF
+EVENT_BUFFER_SIZE = 1024 * 1024
+
+class Inotify:
+    """Minimal ctypes binding to the Linux inotify API."""
+
+    _EVENT = struct.Struct("iIII")
+
+    def __init__(self):
+        self._libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self._libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        self.fd = self._libc.inotify_init1(os.O_CLOEXEC)
+        if self.fd < 0:
+            error = ctypes.get_errno()
+            raise OSError(error, os.strerror(error))
+        self.directories = {}
+
+    def add_watch(self, directory: str) -> int:
+        """Watch a directory, raising OSError (ENOSPC once the watch limit is exhausted) on failure."""
+        wd = self._libc.inotify_add_watch(self.fd, os.fsencode(directory), WATCH_MASK)
+        if wd < 0:
+            error = ctypes.get_errno()
+            raise OSError(error, os.strerror(error), directory)
+        self.directories[wd] = directory
+        return wd
+
+    def remove_watches(self, directory: str) -> None:
+        """Stop watching a directory and everything below it, e.g. once it has been moved away."""
+        for wd, watched in list(self.directories.items()):
+            if _is_under(watched, directory):
+                self._libc.inotify_rm_watch(self.fd, wd)
+                del self.directories[wd]
+
+    def read_events(self, timeout: float) -> list:
+        """Return the pending (directory, mask, name) events, waiting at most timeout seconds for one.
+
+        directory is None for queue overflows, which mean events were lost.
+        """
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return []
+        data = os.read(self.fd, EVENT_BUFFER_SIZE)
+        events = []
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, length = self._EVENT.unpack_from(data, offset)
+            offset += self._EVENT.size
+            name = os.fsdecode(data[offset:offset + length].rstrip(b"\0"))
+            offset += length
+            if mask & IN_IGNORED:
+                self.directories.pop(wd, None)
+                continue
+            events.append((self.directories.get(wd), mask, name))
+        return events
+
+    def close(self) -> None:
+        os.close(self.fd)
+
+def _is_under(file_path: str, directory: str) -> bool:
+    """Return True if file_path is directory or lies below it."""
+    return file_path == directory or file_path.startswith(directory.rstrip(os.sep) + os.sep)
+
+class TreeWatcher:
+    """Keep a live path -> (signature, hash, fast_hash) map of a tree up to date from inotify events.
+
+    Directories that cannot be watched, because the watch limit is exhausted, and the whole tree after
+    an event queue overflow are brought up to date by rescanning them, reusing the hashes of files
+    whose stat signature did not change. With baseline, a path -> hash lookup, files that stop matching
+    it are passed to on_deviation as (path, baseline_hash, hash), either hash None when it is missing.
+    """
+
+    def __init__(self, root: str, hash_options: dict, baseline=None, cache: dict = None, on_deviation=None):
+        self.root = str(Path(root))
+        self.hash_options = hash_options
+        self.baseline = baseline
+        self.on_deviation = on_deviation
+        self.entries = {}
+        # Hashes from an earlier run, only consulted until the initial scan has seen each file
+        self.cache = cache or {}
+        self.unwatched = set()
+        self.changed = False
+        self.inotify = Inotify()
+
+    def watch_subtree(self, directory: str) -> None:
+        """Add watches for a directory and everything below it that is not watched yet."""
+        watched = set(self.inotify.directories.values())
+        for current, subdirectories, _ in os.walk(directory):
+            # Name watched directories like walk_files does, so event paths match the manifest
+            current = str(Path(current))
+            if current in watched:
+                continue
+            try:
+                self.inotify.add_watch(current)
+            except OSError as e:
+                if e.errno not in (errno.ENOSPC, errno.ENOMEM):
+                    typer.echo(f"{Fore.YELLOW}Warning: Could not watch directory {current}: {str(e)}{Style.RESET_ALL}")
+                    continue
+                # Out of watches: cover this subtree with periodic rescans instead
+                if not self.unwatched:
+                    typer.echo(f"{Fore.YELLOW}Warning: inotify watch limit reached, unwatched directories will be rescanned periodically{Style.RESET_ALL}")
+                self.unwatched.add(current)
+                subdirectories[:] = []
+
+    def rescan(self, directory: str) -> None:
+        """Bring every file below directory up to date, dropping the ones that disappeared."""
+        seen = set()
+        for file_path, file_hash, signature, fast_hash in hash_entries(walk_files(directory), cache=self._cache(),
+                                                                       progress=False, **self.hash_options):
+            seen.add(file_path)
+            self.update(file_path, file_hash, signature, fast_hash)
+        for file_path in [path for path in self.entries if _is_under(path, directory) and path not in seen]:
+            self.remove(file_path)
+
+    def refresh(self, file_paths: set) -> None:
+        """Rehash the given files, dropping the ones that no longer exist."""
+        if not file_paths:
+            return
+        existing = []
+        for file_path in file_paths:
+            try:
+                stat_result = os.stat(file_path)
+            except OSError:
+                self.remove(file_path)
+                continue
+            if os.path.isfile(file_path):
+                existing.append((file_path, stat_result))
+        for file_path, file_hash, signature, fast_hash in hash_entries(existing, cache=self._cache(),
+                                                                       progress=False, **self.hash_options):
+            self.update(file_path, file_hash, signature, fast_hash)
+
+    def _cache(self):
+        return ChainMap(self.entries, self.cache) if self.cache else self.entries
+
+    def update(self, file_path: str, file_hash: str, signature: tuple, fast_hash: str) -> None:
+        previous = self.entries.get(file_path)
+        self.entries[file_path] = (signature, file_hash, fast_hash)
+        if previous is None or previous[0] != signature or previous[1] != file_hash:
+            self.changed = True
+        if previous is None or previous[1] != file_hash:
+            self.check(file_path, file_hash)
+
+    def remove(self, file_path: str) -> None:
+        if self.entries.pop(file_path, None) is not None:
+            self.changed = True
+            self.check(file_path, None)
+
+    def check(self, file_path: str, file_hash: str) -> None:
+        """Report a file that no longer matches the baseline."""
+        if self.baseline is None or self.on_deviation is None:
+            return
+        baseline_hash = self.baseline(file_path)
+        if baseline_hash != file_hash:
+            self.on_deviation(file_path, baseline_hash, file_hash)
+
+    def check_missing(self, baseline_entries) -> None:
+        """Report the (path, hash) baseline entries that are not in the live map, e.g. after the initial scan."""
+        for file_path, _ in baseline_entries:
+            if file_path not in self.entries:
+                self.check(file_path, None)
 
+    def collect(self, debounce: float, max_delay: float) -> tuple:
+        """Gather events until none arrive for debounce seconds, returning (files, new_dirs, removed_dirs, overflow)."""
+        files, new_dirs, removed_dirs = set(), set(), set()
+        overflow = False
+        started = time.monotonic()
+        while True:
+            events = self.inotify.read_events(debounce)
+            for directory, mask, name in events:
+                if mask & IN_Q_OVERFLOW:
+                    overflow = True
+                    continue
+                if directory is None:
+                    continue
+                event_path = _child_path(directory, name) if name else directory
+                if mask & (IN_DELETE_SELF | IN_MOVE_SELF):
+                    removed_dirs.add(directory)
+                elif mask & IN_ISDIR:
+                    if mask & (IN_CREATE | IN_MOVED_TO):
+                        new_dirs.add(event_path)
+                    elif mask & (IN_DELETE | IN_MOVED_FROM):
+                        removed_dirs.add(event_path)
+                else:
+                    files.add(event_path)
+            if not events or time.monotonic() - started >= max_delay:
+                return files, new_dirs, removed_dirs, overflow
+
+    def apply(self, files: set, new_dirs: set, removed_dirs: set, overflow: bool) -> None:
+        """Apply one debounced batch of events to the live map."""
+        if not (files or new_dirs or removed_dirs or overflow):
+            return
+        for directory in removed_dirs:
+            self.inotify.remove_watches(directory)
+            self.unwatched = {path for path in self.unwatched if not _is_under(path, directory)}
+            for file_path in [path for path in self.entries if _is_under(path, directory)]:
+                self.remove(file_path)
+        if overflow:
+            typer.echo(f"{Fore.YELLOW}Warning: inotify event queue overflowed, rescanning {self.root}{Style.RESET_ALL}")
+            # Directories created while events were lost have no watch yet; the rescan covers every file
+            self.watch_subtree(self.root)
+            self.rescan(self.root)
+            return
+        for directory in new_dirs:
+            if os.path.isdir(directory):
+                self.watch_subtree(directory)
+                self.rescan(directory)
+        self.refresh(files)
 
 def display_cascading_gradient_red_blue():
     """Display the cascading gradient of red and blue ASCII art."""
@@ -72,12 +1049,29 @@ ______   ______ /   _____/  ____  _____     ____    ____    ____ _______\   \ /
     )
     typer.echo(colored_art)
 
-@app.command()
+app.callback()(global_options(
+    "psscanner", "Scan directories into hash manifests. Options given before the command apply to every command.",
+    metrics_help="Write phase timings, counters and latency histograms to this file"))
+
+@app.command("scan")
 def generate_and_save_hashes(
+    ctx: typer.Context,
     input_path: str = typer.Option(..., "-i", "--input", help="Input directory or file path"),
     output_file: str = typer.Option(..., "-o", "--output", help="Output file path to save hashes"),
+    workers: int = typer.Option(os.cpu_count() or 1, "-w", "--workers", help="Number of parallel hashing workers"),
+    pool: str = typer.Option("thread", "--pool", help="Worker pool type: thread or process"),
+    reuse: str = typer.Option(None, "--reuse", help="Previous manifest whose hashes are reused for unchanged files"),
+    paranoid: float = typer.Option(0.0, "--paranoid", help="Fraction (0-1) of files whose hash would be reused, from the signature or a fast pre-check, to fully rehash anyway"),
+    io_backend: str = typer.Option("read", "--io-backend", help="File read strategy: read, readinto, mmap (may crash with SIGBUS if a file is truncated while mapped, so avoid it on live trees) or fadvise (drops only the pages the scan itself cached, where mincore is available)"),
+    chunk_size: int = typer.Option(CHUNK_SIZE, "--chunk-size", help="Read size in bytes for each chunk"),
+    output_format: str = typer.Option("text", "--format", help="Manifest format: text or binary"),
+    algorithm: str = typer.Option(DEFAULT_ALGORITHM, "-a", "--algorithm", help="Hash algorithm recorded in the manifest"),
+    fast_algorithm: str = typer.Option(None, "--fast-algorithm", help="Two-tier mode: fast hash that decides whether files need the full algorithm"),
+    order: str = typer.Option("inode", "--order", help="Read order within each batch: walk, inode or physical"),
+    shard: str = typer.Option(None, "--shard", help="Scan only shard K of N (K/N), partitioned by top-level entry"),
+    resume: bool = typer.Option(False, "--resume", help="Continue an interrupted scan with the same output from its checkpoint"),
 ) -> None:
-    """Generate SHA512 hashes for files in the specified path and save to a file."""
+    """Generate hashes (SHA512 by default) for files in the specified path and save to a file."""
     typer.echo(f"{Fore.CYAN}Generating hashes for files in {input_path}{Style.RESET_ALL}")
 
     # Check if input exists
@@ -85,22 +1079,258 @@ def generate_and_save_hashes(
         typer.echo(f"{Fore.RED}Error: Path {input_path} does not exist{Style.RESET_ALL}")
         raise typer.TyperExit(code=1)
 
+    if pool not in ("thread", "process"):
+        typer.echo(f"{Fore.RED}Error: Unknown pool type {pool}, expected thread or process{Style.RESET_ALL}")
+        raise typer.Exit(code=1)
+
+    if not 0.0 <= paranoid <= 1.0:
+        typer.echo(f"{Fore.RED}Error: --paranoid must be between 0 and 1{Style.RESET_ALL}")
+        raise typer.Exit(code=1)
+
+    if io_backend not in IO_BACKENDS:
+        typer.echo(f"{Fore.RED}Error: Unknown I/O backend {io_backend}, expected one of {', '.join(IO_BACKENDS)}{Style.RESET_ALL}")
+        raise typer.Exit(code=1)
+
+    if chunk_size <= 0:
+        typer.echo(f"{Fore.RED}Error: --chunk-size must be positive{Style.RESET_ALL}")
+        raise typer.Exit(code=1)
+
+    if order not in READ_ORDERS:
+        typer.echo(f"{Fore.RED}Error: Unknown read order {order}, expected one of {', '.join(READ_ORDERS)}{Style.RESET_ALL}")
+        raise typer.Exit(code=1)
+
+    shard_range = None
+    if shard is not None:
+        try:
+            shard_range = parse_shard(shard)
+        except ValueError as e:
+            typer.echo(f"{Fore.RED}Error: Invalid --shard: {str(e)}{Style.RESET_ALL}")
+            raise typer.Exit(code=1)
+
+    if output_format not in MANIFEST_EXTENSIONS:
+        typer.echo(f"{Fore.RED}Error: Unknown manifest format {output_format}, expected text or binary{Style.RESET_ALL}")
+        raise typer.Exit(code=1)
+
+    for name in (algorithm, fast_algorithm):
+        if name is not None and name not in HASH_ALGORITHMS:
+            typer.echo(f"{Fore.RED}Error: Unknown hash algorithm {name}, expected one of {', '.join(HASH_ALGORITHMS)}{Style.RESET_ALL}")
+            raise typer.Exit(code=1)
+
+    if algorithm not in CRYPTOGRAPHIC_ALGORITHMS:
+        typer.echo(f"{Fore.YELLOW}Warning: {algorithm} is not a cryptographic hash and will not detect deliberate tampering{Style.RESET_ALL}")
+
+    cache = {}
+    if reuse:
+        cache = load_hash_cache(reuse, algorithm, fast_algorithm)
+        typer.echo(f"{Fore.CYAN}Loaded {len(cache)} reusable hashes from {reuse}{Style.RESET_ALL}")
+
+    if shard_range is not None:
+        output_file = f"{output_file}_shard{shard_range[0] + 1}of{shard_range[1]}"
+    # The checkpoint is named without the timestamp so that a resumed run finds it
+    checkpoint_file = output_file + CHECKPOINT_SUFFIX
+    resumed = {}
+    if resume and os.path.exists(checkpoint_file):
+        resumed = load_checkpoint(checkpoint_file, algorithm, fast_algorithm)
+        typer.echo(f"{Fore.CYAN}Resuming from {checkpoint_file} with {len(resumed)} files already hashed{Style.RESET_ALL}")
+    elif resume:
+        typer.echo(f"{Fore.YELLOW}Warning: No checkpoint {checkpoint_file} to resume from, starting over{Style.RESET_ALL}")
+    elif os.path.exists(checkpoint_file):
+        typer.echo(f"{Fore.YELLOW}Warning: Replacing the checkpoint of an interrupted run, pass --resume to continue it instead{Style.RESET_ALL}")
+    cache = {**cache, **resumed}
+
     # Generate timestamp for output filename
     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
     # Append timestamp to the given output filename
-    output_file = f"{output_file}_{timestamp}.txt"
+    output_file = f"{output_file}_{timestamp}{MANIFEST_EXTENSIONS[output_format]}"
 
-    # Generate hashes
+    # Generate hashes and stream them to disk as they are produced
+    typer.echo(f"{Fore.CYAN}Saving hashes to {output_file}{Style.RESET_ALL}")
     start_time = time.time()
-    hashes = generate_hashes(input_path)
+    metrics = ctx.obj if ctx.obj is not None else DISABLED_METRICS
+    stats = metrics.counters if metrics.enabled else {}
+    hashes = iter_hashes(input_path, workers=workers, pool=pool, cache=cache, paranoid=paranoid,
+                         backend=io_backend, chunk_size=chunk_size, stats=stats,
+                         algorithm=algorithm, fast_algorithm=fast_algorithm, order=order, shard=shard_range,
+                         metrics=metrics)
+    # Scheduling and waiting for workers is the dispatch phase, walking and stat calls are timed within it
+    hashes = checkpoint_hashes(metrics.timed(hashes, "dispatch"), checkpoint_file, algorithm, fast_algorithm, resumed)
+    try:
+        file_count = save_hashes_to_file(hashes, output_file, output_file + METADATA_SUFFIX, output_format,
+                                         root=os.path.abspath(input_path), merkle_file=output_file + MERKLE_SUFFIX,
+                                         algorithm=algorithm, fast_file=output_file + FAST_SUFFIX if fast_algorithm else None,
+                                         fast_algorithm=fast_algorithm, metrics=metrics)
+    except (KeyboardInterrupt, typer.Exit):
+        hashes.close()
+        typer.echo(f"{Fore.YELLOW}Scan interrupted, run it again with --resume to continue from {checkpoint_file}{Style.RESET_ALL}")
+        raise
+    os.remove(checkpoint_file)
+    metrics.count("manifest_files", file_count)
     elapsed_time = time.time() - start_time
-
-    typer.echo(f"{Fore.CYAN}Saving hashes to {output_file}{Style.RESET_ALL}")
-    save_hashes_to_file(hashes, output_file)
+    hashed_mb = stats["hashed_bytes"] / (1024 * 1024)
 
     typer.echo(f"{Fore.GREEN}Hashes generated and saved to {output_file}{Style.RESET_ALL}")
-    typer.echo(f"{Fore.BLUE}Processed {len(hashes)} files in {elapsed_time:.2f} seconds{Style.RESET_ALL}")
+    typer.echo(f"{Fore.BLUE}Processed {file_count} files in {elapsed_time:.2f} seconds{Style.RESET_ALL}")
+    typer.echo(f"{Fore.BLUE}Hashed {hashed_mb:.1f} MB with the {io_backend} backend at "
+               f"{hashed_mb / max(elapsed_time, 1e-9):.1f} MB/s ({stats['reused_files']} files reused){Style.RESET_ALL}")
+    if stats["shared_files"]:
+        typer.echo(f"{Fore.BLUE}{stats['shared_files']} hardlinked files shared the hash of an inode read once{Style.RESET_ALL}")
+    if fast_algorithm:
+        typer.echo(f"{Fore.BLUE}{stats['fast_reused_files']} changed files kept their {algorithm} hash after a matching {fast_algorithm} pre-check{Style.RESET_ALL}")
+
+@app.command("convert")
+def convert_manifest(
+    input_file: str = typer.Option(..., "-i", "--input", help="Manifest to convert, text or binary"),
+    output_file: str = typer.Option(..., "-o", "--output", help="Path of the converted manifest"),
+    root: str = typer.Option("", "--root", help="Scan root recorded when converting text to binary"),
+) -> None:
+    """Convert a text manifest to the binary format, or a binary manifest back to text."""
+    if not os.path.exists(input_file):
+        typer.echo(f"{Fore.RED}Error: Path {input_file} does not exist{Style.RESET_ALL}")
+        raise typer.Exit(code=1)
+
+    try:
+        if is_binary_manifest(input_file):
+            typer.echo(f"{Fore.CYAN}Converting binary manifest {input_file} to text{Style.RESET_ALL}")
+            algorithm = manifest_algorithm(input_file)
+            entries = ((file_path, file_hash, None, None) for file_path, file_hash in iter_manifest(input_file))
+            file_count = save_hashes_to_file(entries, output_file, algorithm=algorithm)
+        else:
+            typer.echo(f"{Fore.CYAN}Converting text manifest {input_file} to binary{Style.RESET_ALL}")
+            algorithm = manifest_algorithm(input_file)
+            try:
+                file_count = write_binary_manifest(iter_manifest(input_file), output_file, algorithm, root)
+            except ValueError:
+                # Hand-edited manifests may be out of order or hold duplicates; the first entry wins, like the validator
+                entries = {}
+                for file_path, file_hash in iter_manifest(input_file):
+                    entries.setdefault(file_path, file_hash)
+                file_count = write_binary_manifest(sorted(entries.items()), output_file, algorithm, root)
+    except (IOError, ValueError) as e:
+        typer.echo(f"{Fore.RED}Error: Could not convert {input_file}: {str(e)}{Style.RESET_ALL}")
+        raise typer.Exit(code=1)
+
+    typer.echo(f"{Fore.GREEN}Converted {file_count} entries to {output_file}{Style.RESET_ALL}")
+
+@app.command("merge")
+def merge_manifests(
+    ctx: typer.Context,
+    input_files: List[str] = typer.Option(..., "-i", "--input", help="Shard manifest to merge, repeat for every shard"),
+    output_file: str = typer.Option(..., "-o", "--output", help="Path of the merged manifest"),
+    output_format: str = typer.Option("text", "--format", help="Manifest format: text or binary"),
+    root: str = typer.Option(None, "--root", help="Scan root recorded in a binary manifest, by default that of the shards"),
+) -> None:
+    """Merge the manifests of a sharded scan into one sorted baseline."""
+    for input_file in input_files:
+        if not os.path.exists(input_file):
+            typer.echo(f"{Fore.RED}Error: Path {input_file} does not exist{Style.RESET_ALL}")
+            raise typer.Exit(code=1)
+
+    if output_format not in MANIFEST_EXTENSIONS:
+        typer.echo(f"{Fore.RED}Error: Unknown manifest format {output_format}, expected text or binary{Style.RESET_ALL}")
+        raise typer.Exit(code=1)
+
+    typer.echo(f"{Fore.CYAN}Merging {len(input_files)} shard manifests into {output_file}{Style.RESET_ALL}")
+    try:
+        file_count = merge_shards(input_files, output_file, output_format, root, ctx.obj)
+    except (IOError, ValueError) as e:
+        typer.echo(f"{Fore.RED}Error: Could not merge shards: {str(e)}{Style.RESET_ALL}")
+        raise typer.Exit(code=1)
+
+    typer.echo(f"{Fore.GREEN}Merged {file_count} entries into {output_file}{Style.RESET_ALL}")
+
+@app.command("watch")
+def watch(
+    input_path: str = typer.Option(..., "-i", "--input", help="Directory to watch"),
+    output_file: str = typer.Option(..., "-o", "--output", help="Live manifest kept up to date, reused on restart"),
+    baseline: str = typer.Option(None, "-b", "--baseline", help="Baseline manifest to flag deviations against"),
+    workers: int = typer.Option(os.cpu_count() or 1, "-w", "--workers", help="Number of parallel hashing workers"),
+    algorithm: str = typer.Option(DEFAULT_ALGORITHM, "-a", "--algorithm", help="Hash algorithm recorded in the manifest"),
+    debounce: float = typer.Option(1.0, "--debounce", help="Seconds without events before a batch of changes is hashed"),
+    flush_interval: float = typer.Option(60.0, "--flush-interval", help="Minimum seconds between live manifest writes"),
+    rescan_interval: float = typer.Option(3600.0, "--rescan-interval", help="Seconds between rescans of directories that could not be watched"),
+) -> None:
+    """Watch a directory with inotify, rehash changed files and keep a live manifest up to date."""
+    if not sys.platform.startswith("linux"):
+        typer.echo(f"{Fore.RED}Error: watch relies on Linux inotify{Style.RESET_ALL}")
+        raise typer.Exit(code=1)
+
+    if not os.path.isdir(input_path):
+        typer.echo(f"{Fore.RED}Error: Directory {input_path} does not exist{Style.RESET_ALL}")
+        raise typer.Exit(code=1)
+
+    if algorithm not in HASH_ALGORITHMS:
+        typer.echo(f"{Fore.RED}Error: Unknown hash algorithm {algorithm}, expected one of {', '.join(HASH_ALGORITHMS)}{Style.RESET_ALL}")
+        raise typer.Exit(code=1)
+
+    baseline_manifest = baseline_lookup = None
+    if baseline:
+        try:
+            if manifest_algorithm(baseline) != algorithm:
+                typer.echo(f"{Fore.RED}Error: Baseline {baseline} was not hashed with {algorithm}{Style.RESET_ALL}")
+                raise typer.Exit(code=1)
+            if is_binary_manifest(baseline):
+                baseline_manifest = BinaryManifest(baseline)
+                baseline_lookup = baseline_manifest.lookup
+            else:
+                baseline_manifest = dict(iter_manifest(baseline))
+                baseline_lookup = baseline_manifest.get
+        except (IOError, ValueError) as e:
+            typer.echo(f"{Fore.RED}Error: Could not read baseline {baseline}: {str(e)}{Style.RESET_ALL}")
+            raise typer.Exit(code=1)
+
+    def report_deviation(file_path: str, baseline_hash: str, file_hash: str) -> None:
+        if baseline_hash is None:
+            typer.echo(f"{Fore.YELLOW}File not in the baseline: {file_path} (hash: {file_hash}){Style.RESET_ALL}")
+        elif file_hash is None:
+            typer.echo(f"{Fore.YELLOW}File from the baseline is missing: {file_path} (hash: {baseline_hash}){Style.RESET_ALL}")
+        else:
+            typer.echo(f"{Fore.RED}Hash mismatch against the baseline for {file_path}: {baseline_hash} -> {file_hash}{Style.RESET_ALL}")
+
+    # Resume from the previous live manifest so a restart only rehashes what changed meanwhile
+    cache = load_hash_cache(output_file, algorithm) if os.path.exists(output_file) else {}
+    watcher = TreeWatcher(input_path, {"workers": workers, "algorithm": algorithm}, baseline_lookup, cache,
+                          report_deviation)
+
+    def flush() -> None:
+        temporary_file = output_file + ".tmp"
+        entries = ((path, file_hash, signature, fast_hash) for path, (signature, file_hash, fast_hash) in watcher.entries.items())
+        save_hashes_to_file(entries, temporary_file, temporary_file + METADATA_SUFFIX, root=os.path.abspath(input_path),
+                            merkle_file=temporary_file + MERKLE_SUFFIX, algorithm=algorithm)
+        for suffix in ("", METADATA_SUFFIX, MERKLE_SUFFIX):
+            os.replace(temporary_file + suffix, output_file + suffix)
+        watcher.changed = False
+
+    typer.echo(f"{Fore.CYAN}Watching {input_path}, live manifest in {output_file}{Style.RESET_ALL}")
+    watcher.watch_subtree(watcher.root)
+    watcher.rescan(watcher.root)
+    watcher.cache = {}
+    if baseline_manifest is not None:
+        watcher.check_missing(baseline_manifest.items() if isinstance(baseline_manifest, dict) else baseline_manifest)
+    flush()
+    last_flush = last_rescan = time.monotonic()
+    typer.echo(f"{Fore.GREEN}Initial scan complete: {len(watcher.entries)} files{Style.RESET_ALL}")
+
+    try:
+        while True:
+            batch = watcher.collect(debounce, debounce * 10)
+            watcher.apply(*batch)
+            now = time.monotonic()
+            if watcher.unwatched and now - last_rescan >= rescan_interval:
+                for directory in list(watcher.unwatched):
+                    watcher.rescan(directory)
+                last_rescan = now
+            if watcher.changed and now - last_flush >= flush_interval:
+                flush()
+                last_flush = now
+    except KeyboardInterrupt:
+        typer.echo(f"{Fore.CYAN}Stopping, saving live manifest to {output_file}{Style.RESET_ALL}")
+    finally:
+        watcher.inotify.close()
+        if isinstance(baseline_manifest, BinaryManifest):
+            baseline_manifest.close()
+    if watcher.changed:
+        flush()
 
 if __name__ == "__main__":
     display_cascading_gradient_red_blue()
-    app()
+    app(args=legacy_command_line(app, sys.argv[1:], "scan"))
@@ -1,126 +1,548 @@
 
+import os
+import io
+import csv
+import sys
+import json
+import locale
+import tempfile
 import typer
+from psManifestV1 import (BinaryManifest, FAST_SUFFIX, HASH_ALGORITHMS, MERKLE_SUFFIX, changed_directories,
+                          is_binary_manifest, manifest_algorithm, merkle_directory, merkle_matches, read_merkle)
+from psScannerV1 import iter_hashes
+from psMetricsV1 import DISABLED_METRICS, global_options, legacy_command_line
 from tqdm import tqdm
 from colorama import Fore, Style
 
 app = typer.Typer()
 
-def read_hash_file(file_path: str) -> dict:
-    """Read a hash file and return a dictionary of file paths and their hashes."""
+# Manifests are written with the platform's default text encoding
+ENCODING = locale.getpreferredencoding(False)
+
+# Exit codes of the compare and verify commands
+EXIT_MATCH = 0
+EXIT_DIFFERENCES = 1
+EXIT_ERROR = 2
+REPORT_FORMATS = ("console", "summary", "jsonl", "csv")
+# Report output is written in blocks of about this many bytes rather than one write per line
+REPORT_BUFFER_SIZE = 1 << 16
+
+class UnsortedHashFileError(Exception):
+    """Raised when a hash file expected to be sorted by path is not."""
+
+def _new_file_counts() -> dict:
+    """Return the counters of problems found while reading one hash file."""
+    return {"format_errors": 0, "first_format_error": None, "duplicates": 0, "first_duplicate": None}
+
+def _count_problem(counts: dict, problem: str, line_num: int) -> None:
+    """Count a malformed ("format_error") or repeated ("duplicate") line of a hash file."""
+    counts[problem + "s"] += 1
+    if counts["first_" + problem] is None:
+        counts["first_" + problem] = line_num
+
+def _warn_file_problems(file_path: str, counts: dict, quiet: bool = False) -> None:
+    """Print one warning per kind of problem found in a hash file to stderr, unless quiet.
+
+    Warnings stay off stdout so they never end up among the records of a jsonl or csv report.
+    """
+    if quiet:
+        return
+    format_errors, duplicates = counts["format_errors"], counts["duplicates"]
+    if format_errors:
+        typer.echo(f"{Fore.YELLOW}Warning: Skipped {format_errors} malformed line{'s' if format_errors != 1 else ''} "
+                   f"in {file_path}, the first at line {counts['first_format_error']}{Style.RESET_ALL}", err=True)
+    if duplicates:
+        typer.echo(f"{Fore.YELLOW}Warning: Ignored {duplicates} duplicate entr{'ies' if duplicates != 1 else 'y'} "
+                   f"in {file_path}, the first at line {counts['first_duplicate']}{Style.RESET_ALL}", err=True)
+
+def iter_hash_file(file_path: str, pbar=None, counts: dict = None, directories: set = None):
+    """Yield (file_path, hash, line_num) for each well-formed line of a text or binary hash file.
+
+    Progress is reported to pbar in bytes read, and malformed lines are counted in counts (see _new_file_counts).
+    With directories, a binary manifest only yields the files directly inside those Merkle directories
+    and steps over the other subtrees without reading them; text manifests are still read in full.
+    """
+    counts = counts if counts is not None else _new_file_counts()
+    if is_binary_manifest(file_path):
+        # Binary manifests are already validated and sorted, entries are read straight from the map
+        with BinaryManifest(file_path) as manifest:
+            if directories is None:
+                entries = ((index, *entry) for index, entry in enumerate(manifest))
+            else:
+                entries = manifest.iter_directories(directories)
+            read = 0
+            for index, hashed_path, file_hash in entries:
+                if pbar is not None:
+                    pbar.update((index + 1 - read) * manifest.record_size)
+                    read = index + 1
+                yield hashed_path, file_hash, index + 1
+            if pbar is not None:
+                pbar.update((manifest.count - read) * manifest.record_size)
+        return
+    with open(file_path, 'rb') as f:
+        for line_num, raw_line in enumerate(f, 1):
+            if pbar is not None:
+                pbar.update(len(raw_line))
+            line = raw_line.decode(ENCODING).strip()
+            if not line or line.startswith('#'):  # Skip empty lines and the algorithm header
+                continue
+
+            # Check for proper format: HASH:filepath
+            file_hash, separator, hashed_path = line.partition(':')
+            if not separator or not file_hash or not hashed_path:
+                _count_problem(counts, "format_error", line_num)
+                continue
+            yield hashed_path, file_hash, line_num
+
+def read_hash_file(file_path: str, progress: bool = True, metrics=None, quiet: bool = False) -> dict:
+    """Read a hash file and return a dictionary of file paths and their hashes.
+
+    Malformed and duplicate lines are summed up in one warning on stderr unless quiet.
+    """
     hashes = {}
-    format_error_count = 0
+    counts = _new_file_counts()
+    metrics = metrics if metrics is not None else DISABLED_METRICS
     try:
-        with open(file_path, 'r') as f:
-            with tqdm(total=sum(1 for _ in open(file_path)), desc=f"Reading {file_path}", unit="line", colour="green") as pbar:
-                for line_num, line in enumerate(f, 1):
-                    line = line.strip()
-                    if not line:  # Skip empty lines
-                        pbar.update(1)
-                        continue
-
-                    # Check for proper format: HASH:filepath
-                    if ':' not in line:
-                        format_error_count += 1
-                        mismatch_during_completion()
-                        typer.echo(f"{Fore.RED}Error: Invalid line format at line {line_num}: {line}")
-                        mismatch_during_completion()
-                        pbar.update(1)
-                        continue
-
-                    parts = line.split(':', 1)
-                    if len(parts) != 2:
-                        format_error_count += 1
-                        mismatch_during_completion()
-                        typer.echo(f"{Fore.RED}Error: Invalid line format at line {line_num}: {line}")
-                        mismatch_during_completion()
-                        pbar.update(1)
-                        continue
-
-                    file_hash, file_path = parts
-                    if not file_hash or not file_path:
-                        format_error_count += 1
-                        mismatch_during_completion()
-                        typer.echo(f"{Fore.RED}Error: Invalid line format at line {line_num}: {line}")
-                        mismatch_during_completion()
-                        pbar.update(1)
-                        continue
-
-                    # Store the hash and file path
-                    if file_path not in hashes:
-                        hashes[file_path] = file_hash
-                    else:
-                        mismatch_during_completion()
-                        typer.echo(f"{Fore.YELLOW}Warning: Duplicate entry for file at line {line_num}: {file_path}")
-                        mismatch_during_completion()
-
-                    pbar.update(1)
-
-        return hashes, format_error_count
+        with tqdm(total=os.path.getsize(file_path), desc=f"Reading {file_path}", unit="B", unit_scale=True, colour="green",
+                  disable=not progress) as pbar:
+            for hashed_path, file_hash, line_num in metrics.timed(iter_hash_file(file_path, pbar, counts), "parse"):
+                # Store the hash and file path
+                if hashed_path not in hashes:
+                    hashes[hashed_path] = file_hash
+                else:
+                    _count_problem(counts, "duplicate", line_num)
+
+        _warn_file_problems(file_path, counts, quiet)
+        metrics.count("format_errors", counts["format_errors"])
+        return hashes, counts["format_errors"]
     except FileNotFoundError:
-        typer.echo(f"Error: File not found - {file_path}")
+        typer.echo(f"Error: File not found - {file_path}", err=True)
         return {}, 0
     except Exception as e:
-        typer.echo(f"Error reading file {file_path}: {str(e)}")
+        typer.echo(f"Error reading file {file_path}: {str(e)}", err=True)
         return {}, 0
 
-def compare_hashes(old_file_path: str, new_file_path: str):
-    """Compare hashes from two files and display appropriate ASCII art."""
-    typer.echo("{Fore.CYAN}\nReading hash files...\n")
-    hashes1, old_format_errors = read_hash_file(old_file_path)
-    hashes2, new_format_errors = read_hash_file(new_file_path)
-
-    if not hashes1 or not hashes2:
-        return
-
+def _sorted_entries(entries, file_path: str, counts: dict):
+    """Pass through (file_path, hash, line_num) entries, counting and skipping duplicates and failing if paths go backwards."""
+    previous_path = None
+    for hashed_path, file_hash, line_num in entries:
+        if previous_path is not None:
+            if hashed_path == previous_path:
+                _count_problem(counts, "duplicate", line_num)
+                continue
+            if hashed_path < previous_path:
+                raise UnsortedHashFileError(f"{file_path} is not sorted at line {line_num}")
+        previous_path = hashed_path
+        yield hashed_path, file_hash
+
+def merge_hash_files(old_file_path: str, new_file_path: str, progress: bool = True, metrics=None,
+                     directories: set = None, quiet: bool = False):
+    """Walk two hash files sorted by path in lockstep and yield (file_path, old_hash, new_hash).
+
+    A hash is None when the file is only recorded on the other side. Only one line of each file is
+    held in memory; UnsortedHashFileError is raised as soon as either file turns out not to be sorted.
+    With directories, binary manifests skip the subtrees outside those Merkle directories. With
+    metrics, reading and parsing the files is timed as the parse phase. Malformed and duplicate
+    lines are summed up in one warning per file on stderr once both are read, unless quiet.
+    """
+    metrics = metrics if metrics is not None else DISABLED_METRICS
+    total = os.path.getsize(old_file_path) + os.path.getsize(new_file_path)
+    old_counts, new_counts = _new_file_counts(), _new_file_counts()
+    with tqdm(total=total, desc="Comparing files", unit="B", unit_scale=True, colour="yellow", disable=not progress) as pbar:
+        old_entries = _sorted_entries(metrics.timed(iter_hash_file(old_file_path, pbar, old_counts, directories), "parse"),
+                                      old_file_path, old_counts)
+        new_entries = _sorted_entries(metrics.timed(iter_hash_file(new_file_path, pbar, new_counts, directories), "parse"),
+                                      new_file_path, new_counts)
+        old_entry = next(old_entries, None)
+        new_entry = next(new_entries, None)
+        while old_entry is not None or new_entry is not None:
+            if new_entry is None or (old_entry is not None and old_entry[0] < new_entry[0]):
+                yield old_entry[0], old_entry[1], None
+                old_entry = next(old_entries, None)
+            elif old_entry is None or new_entry[0] < old_entry[0]:
+                yield new_entry[0], None, new_entry[1]
+                new_entry = next(new_entries, None)
+            else:
+                yield old_entry[0], old_entry[1], new_entry[1]
+                old_entry = next(old_entries, None)
+                new_entry = next(new_entries, None)
+    _warn_file_problems(old_file_path, old_counts, quiet)
+    _warn_file_problems(new_file_path, new_counts, quiet)
+    metrics.count("format_errors", old_counts["format_errors"] + new_counts["format_errors"])
+
+def _join_hash_dicts(hashes1: dict, hashes2: dict, progress: bool = True):
+    """Yield (file_path, old_hash, new_hash) for every file recorded in either dictionary."""
     # Get all unique file names from both files
     all_files = set(hashes1.keys()).union(set(hashes2.keys()))
 
-    # Initialize counters
-    match_count = 0
-    mismatch_count = 0
-    unique_to_old_count = 0
-    unique_to_new_count = 0
-
-
-
     # Create a progress bar for the comparison
-    with tqdm(total=len(all_files), desc="Comparing files", unit="file", colour="yellow") as pbar:
-        for file_path in all_files:
-            if file_path in hashes1 and file_path in hashes2:
-                if hashes1[file_path] == hashes2[file_path]:
-                    match_count += 1
-                else:
-                    mismatch_count += 1
-                    typer.echo(f"{Fore.RED}  Hash mismatch for file: {file_path}\n")
-                    typer.echo(f"{Fore.CYAN}  Hash in older file: {hashes1[file_path]}\n")
-                    typer.echo(f"{Fore.YELLOW}  Hash in newer file: {hashes2[file_path]}\n")
-                    f"{Style.RESET_ALL}"
-                    display_hash_mismatch_warning()
-            elif file_path in hashes1:
-                unique_to_old_count += 1
-                typer.echo(f"{Fore.CYAN}File only recorded in older file:  \n")
-                f"{Style.RESET_ALL}"
-                typer.echo(f"{file_path} (hash: {hashes1[file_path]})")
-                mismatch_during_completion()
+    for file_path in tqdm(all_files, desc="Comparing files", unit="file", colour="yellow", disable=not progress):
+        yield file_path, hashes1.get(file_path), hashes2.get(file_path)
+
+class Report:
+    """Receives the deviations and the summary of a comparison. The base class discards them (--quiet)."""
+
+    def __init__(self, old_label: str = "in older file", new_label: str = "in newer file"):
+        self.old_label = old_label
+        self.new_label = new_label
+
+    def entry(self, status: str, file_path: str, old_hash: str, new_hash: str) -> None:
+        """Record one file whose status is mismatch, unique_to_old or unique_to_new."""
+
+    def summary(self, counts: dict, skipped_directories: int = None) -> None:
+        """Record the final counts of the comparison."""
+
+    def close(self) -> None:
+        """Flush and release the report output."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+class SummaryReport(Report):
+    """Prints only the comparison summary."""
+
+    def summary(self, counts: dict, skipped_directories: int = None) -> None:
+        _display_summary(counts, skipped_directories, self.old_label, self.new_label)
+
+class ConsoleReport(SummaryReport):
+    """Prints every deviation with its colored ASCII art, collecting the output into large terminal writes."""
+
+    def __init__(self, old_label: str = "in older file", new_label: str = "in newer file"):
+        super().__init__(old_label, new_label)
+        self._buffer = io.StringIO()
+
+    def _echo(self, message: str = "") -> None:
+        self._buffer.write(message + "\n")
+        if self._buffer.tell() >= REPORT_BUFFER_SIZE:
+            self.flush()
+
+    def flush(self) -> None:
+        if self._buffer.tell():
+            typer.echo(self._buffer.getvalue(), nl=False)
+            self._buffer = io.StringIO()
+
+    def entry(self, status: str, file_path: str, old_hash: str, new_hash: str) -> None:
+        if status == "mismatch":
+            self._echo(f"{Fore.RED}  Hash mismatch for file: {file_path}\n")
+            self._echo(f"{Fore.CYAN}  Hash {self.old_label}: {old_hash}\n")
+            self._echo(f"{Fore.YELLOW}  Hash {self.new_label}: {new_hash}\n")
+            display_hash_mismatch_warning(self._echo)
+        elif status == "unique_to_old":
+            self._echo(f"{Fore.CYAN}File only recorded {self.old_label}:  \n")
+            self._echo(f"{file_path} (hash: {old_hash})")
+            mismatch_during_completion(self._echo)
+        else:
+            self._echo(f"{Fore.CYAN}File only recorded {self.new_label}:  \n")
+            self._echo(f"{file_path} (hash: {new_hash}) \n")
+            mismatch_during_completion(self._echo)
+            display_name_mismatch_warning(self._echo)
+
+    def summary(self, counts: dict, skipped_directories: int = None) -> None:
+        self.flush()
+        super().summary(counts, skipped_directories)
+
+    def close(self) -> None:
+        self.flush()
+
+class _FileReport(Report):
+    """Writes machine-readable records to a buffered file, or to stdout when no path is given."""
+
+    def __init__(self, path: str = None, old_label: str = "in older file", new_label: str = "in newer file"):
+        super().__init__(old_label, new_label)
+        if path:
+            self._file = open(path, 'w', encoding="utf-8", newline="", buffering=REPORT_BUFFER_SIZE)
+        else:
+            self._file = sys.stdout
+
+    def close(self) -> None:
+        if self._file is sys.stdout:
+            self._file.flush()
+        else:
+            self._file.close()
+
+class JsonLinesReport(_FileReport):
+    """Writes one JSON object per deviation, followed by a summary object."""
+
+    def entry(self, status: str, file_path: str, old_hash: str, new_hash: str) -> None:
+        self._file.write(json.dumps({"status": status, "path": file_path, "old_hash": old_hash, "new_hash": new_hash}) + "\n")
+
+    def summary(self, counts: dict, skipped_directories: int = None) -> None:
+        record = {"status": "summary", **counts}
+        if skipped_directories is not None:
+            record["skipped_directories"] = skipped_directories
+        self._file.write(json.dumps(record) + "\n")
+
+class CsvReport(_FileReport):
+    """Writes one CSV row per deviation under a status,path,old_hash,new_hash header."""
+
+    def __init__(self, path: str = None, old_label: str = "in older file", new_label: str = "in newer file"):
+        super().__init__(path, old_label, new_label)
+        self._writer = csv.writer(self._file)
+        self._writer.writerow(("status", "path", "old_hash", "new_hash"))
+
+    def entry(self, status: str, file_path: str, old_hash: str, new_hash: str) -> None:
+        self._writer.writerow((status, file_path, old_hash or "", new_hash or ""))
+
+class MultiReport(Report):
+    """Forwards everything to several reports, e.g. a JSON Lines file and the console summary."""
+
+    def __init__(self, *reports):
+        super().__init__(reports[0].old_label, reports[0].new_label)
+        self.reports = reports
+
+    def entry(self, status: str, file_path: str, old_hash: str, new_hash: str) -> None:
+        for report in self.reports:
+            report.entry(status, file_path, old_hash, new_hash)
+
+    def summary(self, counts: dict, skipped_directories: int = None) -> None:
+        for report in self.reports:
+            report.summary(counts, skipped_directories)
+
+    def close(self) -> None:
+        for report in self.reports:
+            report.close()
+
+class _DeferredReport(Report):
+    """Holds deviations in a temporary file until replay passes them on, for comparisons that may start over."""
+
+    def __init__(self, report: Report):
+        super().__init__(report.old_label, report.new_label)
+        self._file = tempfile.TemporaryFile('w+', encoding="utf-8")
+
+    def entry(self, status: str, file_path: str, old_hash: str, new_hash: str) -> None:
+        self._file.write(json.dumps((status, file_path, old_hash, new_hash)) + "\n")
+
+    def restart(self) -> None:
+        """Discard the deviations held so far, because the comparison starts over."""
+        self._file.seek(0)
+        self._file.truncate()
+
+    def replay(self, report: Report) -> None:
+        """Pass every held deviation on to report, in the order it was recorded."""
+        self._file.seek(0)
+        for line in self._file:
+            report.entry(*json.loads(line))
+
+    def close(self) -> None:
+        self._file.close()
+
+def open_report(report_format: str = "console", report_file: str = None, quiet: bool = False,
+                old_label: str = "in older file", new_label: str = "in newer file") -> Report:
+    """Build the report for a compare or verify run.
+
+    jsonl and csv reports go to report_file, or to stdout without one; when they go to a file the
+    summary is also printed unless quiet. With quiet, nothing else reaches the console. A report
+    file that cannot be created ends the command with EXIT_ERROR.
+    """
+    if report_format in ("jsonl", "csv"):
+        report_class = JsonLinesReport if report_format == "jsonl" else CsvReport
+        try:
+            report = report_class(report_file, old_label, new_label)
+        except OSError as e:
+            typer.echo(f"{Fore.RED}Error: Cannot write report file {report_file}: {e.strerror}{Style.RESET_ALL}", err=True)
+            raise typer.Exit(code=EXIT_ERROR)
+        if report_file and not quiet:
+            report = MultiReport(report, SummaryReport(old_label, new_label))
+        return report
+    if quiet:
+        return Report(old_label, new_label)
+    if report_format == "summary":
+        return SummaryReport(old_label, new_label)
+    return ConsoleReport(old_label, new_label)
+
+def _tally_comparison(entries, directories: set = None, report: Report = None, metrics=None) -> dict:
+    """Count matches, mismatches and files recorded on only one side, passing every deviation to report.
+
+    With directories, only files directly inside one of those Merkle directories are considered.
+    Without a report, deviations are printed to the console. With metrics, the time spent reporting
+    is timed as the report phase.
+    """
+    metrics = metrics if metrics is not None else DISABLED_METRICS
+    owned = report is None
+    report = report if report is not None else ConsoleReport()
+    # Initialize counters
+    counts = {"match": 0, "mismatch": 0, "unique_to_old": 0, "unique_to_new": 0}
+    try:
+        for file_path, old_hash, new_hash in entries:
+            if directories is not None and merkle_directory(file_path) not in directories:
+                continue
+            if old_hash is not None and new_hash is not None:
+                if old_hash == new_hash:
+                    counts["match"] += 1
+                    continue
+                status = "mismatch"
+            elif old_hash is not None:
+                status = "unique_to_old"
             else:
-                unique_to_new_count += 1
-                typer.echo(f"{Fore.CYAN}File only recorded in new file:  \n")
-                f"{Style.RESET_ALL}"
-                typer.echo(f"{file_path} (hash: {hashes2[file_path]}) \n")
-                mismatch_during_completion()
-                display_name_mismatch_warning()
+                status = "unique_to_new"
+            counts[status] += 1
+            metrics.start("report")
+            try:
+                report.entry(status, file_path, old_hash, new_hash)
+            finally:
+                metrics.stop()
+    finally:
+        if owned:
+            report.close()
+    return counts
+
+def _compare_merkle(old_file_path: str, new_file_path: str, warn: bool = True):
+    """Compare the Merkle sidecars of two manifests, if both exist and belong to them.
+
+    Returns None when either sidecar is missing or was computed from another manifest, otherwise
+    (changed, skipped, file_count): the directories that need a per-file comparison, the number of
+    identical subtrees that were not entered and the number of files in the new manifest. With warn,
+    falling back to the per-file comparison is explained on stderr.
+    """
+    old_merkle_path = old_file_path + MERKLE_SUFFIX
+    new_merkle_path = new_file_path + MERKLE_SUFFIX
+    if not os.path.exists(old_merkle_path) or not os.path.exists(new_merkle_path):
+        return None
+    try:
+        old_digests, old_binding = read_merkle(old_merkle_path)
+        new_digests, new_binding = read_merkle(new_merkle_path)
+        # A sidecar left next to a replaced manifest would otherwise vouch for files it never saw
+        stale = [path for path, binding, manifest in ((old_merkle_path, old_binding, old_file_path),
+                                                      (new_merkle_path, new_binding, new_file_path))
+                 if not merkle_matches(binding, manifest)]
+    except (IOError, ValueError) as e:
+        if warn:
+            typer.echo(f"{Fore.YELLOW}Warning: Could not read Merkle files, comparing every file: {str(e)}{Style.RESET_ALL}", err=True)
+        return None
+    if stale:
+        if warn:
+            typer.echo(f"{Fore.YELLOW}Warning: {', '.join(stale)} does not match its manifest, comparing every file{Style.RESET_ALL}", err=True)
+        return None
+    changed, visited = changed_directories(old_digests, new_digests)
+    return changed, visited - len(changed), new_binding[2]
+
+def compare_hashes(old_file_path: str, new_file_path: str, mode: str = "auto", merkle: bool = True,
+                   report: Report = None, quiet: bool = False, metrics=None, warn: bool = None):
+    """Compare hashes from two files and pass the deviations and summary to report (the console by default).
+
+    In "stream" mode both files must be sorted by path and are merge-joined with constant memory.
+    In "dict" mode both are loaded into memory. "auto" streams and falls back to "dict" for unsorted files.
+    With merkle, Merkle sidecars written by the scanner are compared first and only files in
+    directories whose digests differ are compared. With quiet, progress bars and status messages are
+    suppressed. Warnings about malformed or duplicate lines go to stderr with warn, which defaults to
+    not quiet. With metrics, the merkle, parse, compare and report phases are timed. Returns the
+    comparison counts, or None if the files could not be compared.
+    """
+    owned = report is None
+    report = report if report is not None else ConsoleReport()
+    metrics = metrics if metrics is not None else DISABLED_METRICS
+    try:
+        return _compare_hashes(old_file_path, new_file_path, mode, merkle, report, quiet, metrics,
+                               not quiet if warn is None else warn)
+    finally:
+        if owned:
+            report.close()
+
+def _compare_hashes(old_file_path: str, new_file_path: str, mode: str, merkle: bool, report: Report, quiet: bool,
+                    metrics, warn: bool):
+    """Run compare_hashes with an open report."""
+    def status(message: str) -> None:
+        if not quiet:
+            typer.echo(message)
+
+    # Digests of different algorithms never match, comparing them would flag every file
+    try:
+        old_algorithm = manifest_algorithm(old_file_path)
+        new_algorithm = manifest_algorithm(new_file_path)
+    except FileNotFoundError as e:
+        typer.echo(f"Error: File not found - {e.filename}", err=True)
+        return
+    except (IOError, ValueError) as e:
+        typer.echo(f"Error reading hash files: {str(e)}", err=True)
+        return
+    if old_algorithm != new_algorithm:
+        typer.echo(f"{Fore.RED}Error: {old_file_path} uses {old_algorithm} but {new_file_path} uses {new_algorithm}, "
+                   f"rescan with the same algorithm to compare them{Style.RESET_ALL}", err=True)
+        return
 
-            pbar.update(1)
+    directories = None
+    skipped_directories = 0
+    with metrics.phase("merkle"):
+        merkle_result = _compare_merkle(old_file_path, new_file_path, warn) if merkle else None
+    if merkle_result is not None:
+        directories, skipped_directories, file_count = merkle_result
+        metrics.count("skipped_directories", skipped_directories)
+        if not directories:
+            status(f"{Fore.CYAN}Merkle root digests match, skipping the per-file comparison{Style.RESET_ALL}")
+            # Equal roots mean every recorded file matches
+            counts = {"match": file_count, "mismatch": 0, "unique_to_old": 0, "unique_to_new": 0}
+            report.summary(counts, skipped_directories)
+            return counts
+        status(f"{Fore.CYAN}{len(directories)} directories differ, {skipped_directories} identical subtrees skipped{Style.RESET_ALL}")
+
+    counts = None
+    if mode != "dict":
+        status(f"{Fore.CYAN}\nStreaming hash files...\n")
+        # In auto mode a file may still turn out unsorted, so deviations are held back until the stream ends
+        stream_report = _DeferredReport(report) if mode == "auto" else report
+        try:
+            try:
+                entries = metrics.timed(merge_hash_files(old_file_path, new_file_path, not quiet, metrics,
+                                                         directories, not warn), "compare")
+                counts = _tally_comparison(entries, directories, stream_report, metrics)
+            except FileNotFoundError as e:
+                typer.echo(f"Error: File not found - {e.filename}", err=True)
+                return
+            except (UnicodeDecodeError, OSError) as e:
+                # Mirror the in-memory path, which gives up on unreadable hash files
+                typer.echo(f"{Fore.RED}Error reading hash files: {str(e)}{Style.RESET_ALL}", err=True)
+                return
+            except UnsortedHashFileError as e:
+                if mode == "stream":
+                    typer.echo(f"{Fore.RED}Error: {str(e)}{Style.RESET_ALL}", err=True)
+                    return
+                status(f"{Fore.YELLOW}Warning: {str(e)}, restarting the comparison in memory{Style.RESET_ALL}")
+                stream_report.restart()
+            if counts is not None and directories is None and (counts["match"] + counts["mismatch"] == 0
+                                       and (counts["unique_to_old"] == 0 or counts["unique_to_new"] == 0)):
+                # Mirror the in-memory path, which gives up when either file holds no hashes
+                return None
+            if counts is not None and stream_report is not report:
+                with metrics.phase("report"):
+                    stream_report.replay(report)
+        finally:
+            if stream_report is not report:
+                stream_report.close()
+
+    if counts is None:
+        status(f"{Fore.CYAN}\nReading hash files...\n")
+        hashes1, old_format_errors = read_hash_file(old_file_path, not quiet, metrics, not warn)
+        hashes2, new_format_errors = read_hash_file(new_file_path, not quiet, metrics, not warn)
+
+        if not hashes1 or not hashes2:
+            return None
+
+        entries = metrics.timed(_join_hash_dicts(hashes1, hashes2, not quiet), "compare")
+        counts = _tally_comparison(entries, directories, report, metrics)
+
+    with metrics.phase("report"):
+        report.summary(counts, skipped_directories if directories is not None else None)
+    return counts
+
+def _display_summary(counts: dict, skipped_directories: int = None, old_label: str = "in older file",
+                     new_label: str = "in newer file") -> None:
+    """Display the comparison summary and the matching ASCII art."""
+    match_count = counts["match"]
+    mismatch_count = counts["mismatch"]
+    unique_to_old_count = counts["unique_to_old"]
+    unique_to_new_count = counts["unique_to_new"]
 
     # Display summary
     typer.echo("\nComparison Summary:")
     typer.echo(f"- Matching files: {match_count}")
     typer.echo(f"- Hash mismatches: {mismatch_count}")
-    typer.echo(f"- File(s) only in older file: {unique_to_old_count}")
-    typer.echo(f"- File(s) only in newer file: {unique_to_new_count}")
-    if not hashes1 or not hashes2:
-        typer.echo("Format errors detected in one or both files.")
-        return
+    typer.echo(f"- File(s) only {old_label}: {unique_to_old_count}")
+    typer.echo(f"- File(s) only {new_label}: {unique_to_new_count}")
+    if skipped_directories is not None:
+        typer.echo(f"- Identical directory subtrees skipped: {skipped_directories}")
     # If no mismatches were found
     if mismatch_count == 0 and unique_to_old_count == 0 and unique_to_new_count == 0:
         display_successful_completion()
@@ -132,7 +554,64 @@ def compare_hashes(old_file_path: str, new_file_path: str):
     elif mismatch_count == 0 and unique_to_old_count != 0 and unique_to_new_count !=0:
         typer.echo("The above file(s) has/have been added/removed since the baseline scan was performed. See the output above to identify it/them by name.")
 
+def _verify_entries(lookup, baseline_entries, hashes, fail_fast: bool):
+    """Yield (file_path, baseline_hash, disk_hash) as files are hashed, then for baseline files never seen on disk."""
+    seen = set()
+    for file_path, file_hash, *_ in hashes:
+        seen.add(file_path)
+        baseline_hash = lookup(file_path)
+        yield file_path, baseline_hash, file_hash
+        if fail_fast and baseline_hash != file_hash:
+            return
+    for file_path, baseline_hash in baseline_entries:
+        if file_path not in seen:
+            yield file_path, baseline_hash, None
+            if fail_fast:
+                return
+
+def verify_tree(baseline_path: str, root: str, workers: int = 1, fail_fast: bool = False,
+                report: Report = None, progress: bool = True, metrics=None, warn: bool = None):
+    """Hash the files under root and compare each against a baseline manifest as soon as it is hashed.
+
+    No manifest is written. Deviations go to report (the console by default); files recorded in the
+    baseline but missing on disk are reported once the walk finishes. With fail_fast, the run stops
+    at the first deviation. With metrics, parsing the baseline and hashing the tree are instrumented
+    like a scan. Warnings about malformed baseline lines go to stderr with warn, which defaults to
+    progress. Returns the comparison counts, or None if the baseline could not be read.
+    """
+    metrics = metrics if metrics is not None else DISABLED_METRICS
+    try:
+        algorithm = manifest_algorithm(baseline_path)
+    except FileNotFoundError:
+        typer.echo(f"Error: File not found - {baseline_path}", err=True)
+        return None
+    except (IOError, ValueError) as e:
+        typer.echo(f"Error reading file {baseline_path}: {str(e)}", err=True)
+        return None
+    if algorithm not in HASH_ALGORITHMS:
+        typer.echo(f"{Fore.RED}Error: {baseline_path} uses {algorithm}, which is not available here{Style.RESET_ALL}", err=True)
+        return None
+
+    if is_binary_manifest(baseline_path):
+        # Binary baselines are looked up straight from the map instead of being loaded
+        baseline = BinaryManifest(baseline_path)
+        lookup, baseline_entries = baseline.lookup, baseline
+    else:
+        baseline = None
+        hashes, _ = read_hash_file(baseline_path, progress, metrics, not (progress if warn is None else warn))
+        if not hashes:
+            return None
+        lookup, baseline_entries = hashes.get, hashes.items()
 
+    try:
+        stats = metrics.counters if metrics.enabled else None
+        hashes = iter_hashes(root, workers=workers, stats=stats, algorithm=algorithm, progress=progress, metrics=metrics)
+        entries = _verify_entries(lookup, baseline_entries, metrics.timed(hashes, "dispatch"), fail_fast)
+        counts = _tally_comparison(entries, report=report, metrics=metrics)
+    finally:
+        if baseline is not None:
+            baseline.close()
+    return counts
 
 
 
@@ -160,7 +639,7 @@ ______   ______\   \ /   /_____   |  |  |__|  __| _/_____  _/  |_  ____ _______\
     )
     typer.echo(colored_art)
 
-def display_name_mismatch_warning():
+def display_name_mismatch_warning(echo=typer.echo):
     """Display the name mismatch warning ASCII art in light orange/light yellow."""
     art = r"""
                                           .__                       __         .__      
@@ -181,10 +660,10 @@ def display_name_mismatch_warning():
         f"{Fore.LIGHTYELLOW_EX}      \\/     \\/      \\/     \\//_____/     \\/          \\/        \\/     \\/          \\/     \\/\n"
         f"{Style.RESET_ALL}"
     )
-    typer.echo(colored_art)
+    echo(colored_art)
 
 
-def display_hash_mismatch_warning():
+def display_hash_mismatch_warning(echo=typer.echo):
     """Display the hash mismatch warning ASCII art in dark orange/red."""
     art = r"""
 .__                  .__                   .__                       __         .__      
@@ -205,7 +684,7 @@ def display_hash_mismatch_warning():
         f"{Fore.LIGHTRED_EX}     \\/      \\/      \\/     \\//_____/    \\/          \\/        \\/     \\/            \\/     \\/\n"
         f"{Style.RESET_ALL}"
     )
-    typer.echo(colored_art)
+    echo(colored_art)
 
 def display_successful_completion():
     """Display the successful completion ASCII art with no changes detected."""
@@ -230,7 +709,7 @@ _/ ____\|__||  |    ____    ______      _____  _____  _/  |_   ____  |  |__
     )
     typer.echo(colored_art)
 
-def mismatch_during_completion():
+def mismatch_during_completion(echo=typer.echo):
     """Display the successful completion ASCII art with no changes detected."""
 
     art = r"""
@@ -255,21 +734,116 @@ ____  ___               ____  ___               ____  ___               ____  __
         f"{Fore.RED}      \\_/                     \\_/                     \\_/                     \\_/                     \\_/ \n"
         f"{Style.RESET_ALL}"
     )
-    typer.echo(colored_art)                                                                                                         
+    echo(colored_art)                                                                                                         
                                                                                                           
                                                                                                           
 
-@app.command()
+app.callback()(global_options(
+    "psvalidator", "Compare hash manifests. Options given before the command apply to every command.", EXIT_ERROR,
+    slowest_help="List the N files that took longest to hash (verify only)"))
+
+@app.command("compare")
 def main(
+    ctx: typer.Context,
     old_file_path: str = typer.Option(..., "-o", "--old-file", help="Path to the old hash file"),
-    new_file_path: str = typer.Option(..., "-n", "--new-file", help="Path to the new hash file")
+    new_file_path: str = typer.Option(..., "-n", "--new-file", help="Path to the new hash file"),
+    mode: str = typer.Option("auto", "--mode", help="Comparison strategy: auto, stream (sorted files only) or dict"),
+    merkle: bool = typer.Option(True, "--merkle/--no-merkle", help="Use Merkle sidecars to skip identical directories"),
+    tier: str = typer.Option("full", "--tier", help="Compare the full manifests, or the fast-hash sidecars of two-tier scans"),
+    report_format: str = typer.Option("console", "--report", help="Report format: console, summary, jsonl or csv"),
+    report_file: str = typer.Option(None, "--report-file", help="File for jsonl and csv reports instead of stdout"),
+    quiet: bool = typer.Option(False, "-q", "--quiet", help="Print nothing but errors, the exit code tells the result"),
+):
+    """Compare hashes from two files and report the differences.
+
+    Exits with 0 when both files match, 1 when they differ and 2 when they could not be compared.
+    """
+    if tier not in ("full", "fast"):
+        typer.echo(f"{Fore.RED}Error: Unknown tier {tier}, expected full or fast{Style.RESET_ALL}", err=True)
+        raise typer.Exit(code=EXIT_ERROR)
+    if tier == "fast":
+        # Fast sidecars share the manifest text format but have no Merkle sidecar of their own
+        old_file_path += FAST_SUFFIX
+        new_file_path += FAST_SUFFIX
+        merkle = False
+    if mode not in ("auto", "stream", "dict"):
+        typer.echo(f"{Fore.RED}Error: Unknown mode {mode}, expected auto, stream or dict{Style.RESET_ALL}", err=True)
+        raise typer.Exit(code=EXIT_ERROR)
+    if report_format not in REPORT_FORMATS:
+        typer.echo(f"{Fore.RED}Error: Unknown report format {report_format}, expected one of {', '.join(REPORT_FORMATS)}{Style.RESET_ALL}", err=True)
+        raise typer.Exit(code=EXIT_ERROR)
+    # Records written to stdout must not be mixed with status messages
+    quiet_status = quiet or (report_format in ("jsonl", "csv") and not report_file)
+    if not quiet_status:
+        typer.echo(f"Comparing hashes from {old_file_path} and {new_file_path}...\n")
+    with open_report(report_format, report_file, quiet) as report:
+        counts = compare_hashes(old_file_path, new_file_path, mode, merkle, report, quiet_status, ctx.obj, not quiet)
+    _record_counts(ctx.obj, counts)
+    raise typer.Exit(code=_exit_code(counts))
+
+def _record_counts(metrics, counts: dict) -> None:
+    """Add the comparison counts of a run to its metrics."""
+    if metrics is not None and counts is not None:
+        for name, value in counts.items():
+            metrics.count(name, value)
+
+def _exit_code(counts: dict) -> int:
+    """Map comparison counts, or None after an error, to the exit code of the command."""
+    if counts is None:
+        return EXIT_ERROR
+    if counts["mismatch"] + counts["unique_to_old"] + counts["unique_to_new"]:
+        return EXIT_DIFFERENCES
+    return EXIT_MATCH
+
+@app.command("verify")
+def verify(
+    ctx: typer.Context,
+    baseline_path: str = typer.Option(..., "-b", "--baseline", help="Baseline hash file to verify against"),
+    root: str = typer.Option(..., "-i", "--input", help="Directory or file to verify, given as it was when the baseline was scanned"),
+    workers: int = typer.Option(os.cpu_count() or 1, "-w", "--workers", help="Number of parallel hashing workers"),
+    fail_fast: bool = typer.Option(False, "--fail-fast", help="Stop at the first deviation"),
+    report_format: str = typer.Option("console", "--report", help="Report format: console, summary, jsonl or csv"),
+    report_file: str = typer.Option(None, "--report-file", help="File for jsonl and csv reports instead of stdout"),
+    quiet: bool = typer.Option(False, "-q", "--quiet", help="Print nothing but errors, the exit code tells the result"),
 ):
-    """Compare hashes from two files and display appropriate ASCII art."""
-    typer.echo(f"Comparing hashes from {old_file_path} and {new_file_path}...\n")
-    compare_hashes(old_file_path, new_file_path)
+    """Hash the live filesystem and compare it against a baseline without writing a new hash file.
+
+    Exits with 0 when the filesystem matches, 1 when it deviates and 2 when it could not be verified.
+    """
+    if not os.path.exists(root):
+        typer.echo(f"{Fore.RED}Error: Path {root} does not exist{Style.RESET_ALL}", err=True)
+        raise typer.Exit(code=EXIT_ERROR)
+    if report_format not in REPORT_FORMATS:
+        typer.echo(f"{Fore.RED}Error: Unknown report format {report_format}, expected one of {', '.join(REPORT_FORMATS)}{Style.RESET_ALL}", err=True)
+        raise typer.Exit(code=EXIT_ERROR)
+    quiet_status = quiet or (report_format in ("jsonl", "csv") and not report_file)
+    if not quiet_status:
+        typer.echo(f"Verifying {root} against {baseline_path}...\n")
+    with open_report(report_format, report_file, quiet, old_label="in baseline", new_label="on disk") as report:
+        counts = verify_tree(baseline_path, root, workers, fail_fast, report, not quiet_status, ctx.obj, not quiet)
+        _record_counts(ctx.obj, counts)
+        exit_code = _exit_code(counts)
+        if fail_fast and exit_code == EXIT_DIFFERENCES and not quiet_status:
+            typer.echo(f"{Fore.RED}Stopped at the first deviation (--fail-fast){Style.RESET_ALL}")
+        if counts is not None:
+            report.summary(counts)
+    raise typer.Exit(code=exit_code)
+
+def _quiet_command_line(argv: list) -> bool:
+    """Tell whether a command line asks for --quiet or for a jsonl or csv report on stdout."""
+    if "-q" in argv or "--quiet" in argv:
+        return True
+    report_format = next((argv[i + 1] for i, arg in enumerate(argv[:-1]) if arg == "--report"), None)
+    report_format = next((arg.partition("=")[2] for arg in argv if arg.startswith("--report=")), report_format)
+    has_report_file = any(arg == "--report-file" or arg.startswith("--report-file=") for arg in argv)
+    return report_format in ("jsonl", "csv") and not has_report_file
 
 if __name__ == "__main__":
-    display_cascading_gradient_red_blue()
-    typer.echo("Use the -o flag to specify a baseline hash file, and the -n flag to specify the current hash file to compare them.")
-    typer.echo("Keep libraries updated using pip update within your Venv")
-    app()
\ No newline at end of file
+    # The banner would end up in front of the records of a report written to stdout
+    if not _quiet_command_line(sys.argv[1:]):
+        display_cascading_gradient_red_blue()
+        typer.echo("Use the compare command with the -o flag to specify a baseline hash file, and the -n flag to specify the current hash file to compare them.")
+        typer.echo("Use the verify command with the -b flag to specify a baseline hash file, and the -i flag to check the live filesystem against it.")
+        typer.echo("Use --report jsonl or csv for machine-readable output, and --quiet to rely on the exit code alone.")
+        typer.echo("Keep libraries updated using pip update within your Venv")
+    app(args=legacy_command_line(app, sys.argv[1:], "compare"))
@@ -0,0 +1,20 @@
+import os
+import sys
+
+import pytest
+
+# The tools are plain scripts at the top of the repository
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+@pytest.fixture
+def tree(tmp_path):
+    """A small tree spread over nested directories, including names that sort around the separator."""
+    root = tmp_path / "tree"
+    for index in range(40):
+        directory = root / f"d{index % 4}" / f"e{index % 3}"
+        directory.mkdir(parents=True, exist_ok=True)
+        (directory / f"f{index}").write_text(f"content {index}")
+    (root / "d0-x").write_text("dash")
+    (root / "d0.txt").write_text("dot")
+    (root / "top").write_text("top")
+    return root
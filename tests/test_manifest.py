@@ -0,0 +1,77 @@
+from typer.testing import CliRunner
+
+from psManifestV1 import BinaryManifest, MerkleBuilder, changed_directories, merkle_directory, write_binary_manifest
+from psScannerV1 import app, iter_hashes, iter_manifest, save_hashes_to_file
+
+runner = CliRunner()
+
+def _scan(tree, output_file, **options):
+    hashes = iter_hashes(str(tree), progress=False)
+    save_hashes_to_file(hashes, str(output_file), **options)
+
+def test_convert_round_trip(tree, tmp_path):
+    text_file = tmp_path / "manifest.txt"
+    binary_file = tmp_path / "manifest.psm"
+    back_file = tmp_path / "back.txt"
+    _scan(tree, text_file)
+
+    result = runner.invoke(app, ["convert", "-i", str(text_file), "-o", str(binary_file), "--root", str(tree)])
+    assert result.exit_code == 0, result.output
+    result = runner.invoke(app, ["convert", "-i", str(binary_file), "-o", str(back_file)])
+    assert result.exit_code == 0, result.output
+
+    assert back_file.read_bytes() == text_file.read_bytes()
+    with BinaryManifest(str(binary_file)) as manifest:
+        assert manifest.root == str(tree)
+        assert list(manifest) == list(iter_manifest(str(text_file)))
+
+def test_convert_sorts_unsorted_text(tmp_path):
+    text_file = tmp_path / "manifest.txt"
+    text_file.write_text(f"{'b' * 128}:z\n{'a' * 128}:a\n{'c' * 128}:z\n")
+    binary_file = tmp_path / "manifest.psm"
+    result = runner.invoke(app, ["convert", "-i", str(text_file), "-o", str(binary_file)])
+    assert result.exit_code == 0, result.output
+    with BinaryManifest(str(binary_file)) as manifest:
+        assert list(manifest) == [("a", "a" * 128), ("z", "b" * 128)]
+
+def test_binary_lookup(tmp_path):
+    entries = [(f"dir{index % 3}/file{index}", f"{index:0128x}") for index in range(50)]
+    binary_file = tmp_path / "manifest.psm"
+    write_binary_manifest(sorted(entries), str(binary_file))
+    with BinaryManifest(str(binary_file)) as manifest:
+        for file_path, file_hash in entries:
+            assert manifest.lookup(file_path) == file_hash
+        assert manifest.lookup("dir0/missing") is None
+
+def test_merkle_digests_follow_content():
+    def digests(entries):
+        builder = MerkleBuilder()
+        for file_path, file_hash in sorted(entries.items()):
+            builder.add(file_path, file_hash)
+        return builder.finish()
+
+    entries = {"a/x": "1", "a/b/y": "2", "c/z": "3", "top": "4"}
+    old_digests = digests(entries)
+    assert changed_directories(old_digests, digests(entries)) == (set(), 1)
+    changed, _ = changed_directories(old_digests, digests({**entries, "a/b/y": "5"}))
+    assert changed == {".", "a/", "a/b/"}
+
+def test_iter_directories_matches_filter(tree, tmp_path):
+    old_file = tmp_path / "old.psm"
+    new_file = tmp_path / "new.psm"
+    _scan(tree, old_file, output_format="binary")
+    (tree / "d2" / "e1" / "changed").write_text("new")
+    _scan(tree, new_file, output_format="binary")
+
+    digests = []
+    for manifest_file in (old_file, new_file):
+        builder = MerkleBuilder()
+        for file_path, file_hash in iter_manifest(str(manifest_file)):
+            builder.add(file_path, file_hash)
+        digests.append(builder.finish())
+    changed, _ = changed_directories(*digests)
+
+    with BinaryManifest(str(new_file)) as manifest:
+        expected = [entry for entry in manifest if merkle_directory(entry[0]) in changed]
+        assert [(path, file_hash) for _, path, file_hash in manifest.iter_directories(changed)] == expected
+        assert 0 < len(expected) < len(manifest)
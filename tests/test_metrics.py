@@ -0,0 +1,57 @@
+import json
+
+import pytest
+from typer.testing import CliRunner
+
+import psMetricsV1
+import psScannerV1
+from psMetricsV1 import Metrics, legacy_command_line
+
+class FakeClock:
+    """A perf_counter that only moves when told to."""
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+def test_nested_phases_are_exclusive(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(psMetricsV1.time, "perf_counter", clock)
+    metrics = Metrics("psscanner", "scan")
+    with metrics.phase("walk"):
+        clock.now += 1
+        with metrics.phase("sort"):
+            clock.now += 2
+        clock.now += 4
+    assert metrics.phases == {"walk": 5, "sort": 2}
+
+def test_latency_histogram_and_slowest_files():
+    metrics = Metrics("psscanner", "scan", slowest=2)
+    for file_path, seconds in (("a", 0.002), ("b", 0.3), ("c", 20.0)):
+        metrics.observe(file_path, seconds, 10)
+    histogram = metrics.to_dict()["file_hash_seconds"]
+    assert (histogram["buckets"]["0.005"], histogram["buckets"]["0.5"], histogram["buckets"]["+Inf"]) == (1, 2, 3)
+    assert [file_path for _, file_path, _ in metrics.slowest_files()] == ["c", "b"]
+    assert 'psscanner_file_hash_seconds_bucket{command="scan",le="10.0"} 2' in metrics.to_prometheus()
+
+@pytest.mark.parametrize("metrics_format", ["prometheus", "json"])
+def test_scan_writes_metrics(tree, tmp_path, metrics_format):
+    metrics_file = tmp_path / "scan.metrics"
+    result = CliRunner().invoke(psScannerV1.app, ["--metrics", str(metrics_file), "--metrics-format", metrics_format,
+                                                  "scan", "-i", str(tree), "-o", str(tmp_path / "scan.txt")])
+    assert result.exit_code == 0
+    content = metrics_file.read_text()
+    if metrics_format == "json":
+        record = json.loads(content)
+        assert (record["tool"], record["command"], record["counters"]["hashed_files"]) == ("psscanner", "scan", 43)
+        assert record["file_hash_seconds"]["count"] == 43
+    else:
+        assert 'psscanner_hashed_files{command="scan"} 43' in content.splitlines()
+
+def test_legacy_command_line_inserts_the_default_command():
+    assert legacy_command_line(psScannerV1.app, ["--metrics", "m.prom", "-i", "dir"], "scan") == \
+        ["--metrics", "m.prom", "scan", "-i", "dir"]
+    assert legacy_command_line(psScannerV1.app, ["--slowest=5", "watch", "-i", "dir"], "scan") == \
+        ["--slowest=5", "watch", "-i", "dir"]
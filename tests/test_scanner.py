@@ -0,0 +1,154 @@
+import os
+import hashlib
+
+import pytest
+
+import psScannerV1
+from psScannerV1 import (CHECKPOINT_HEADER, checkpoint_hashes, iter_hashes, load_checkpoint, load_hash_cache, merge_shards,
+                         non_resident_ranges, parse_shard, save_hashes_to_file, walk_files)
+
+def test_relative_paths_have_no_dot_prefix(tree, monkeypatch):
+    monkeypatch.chdir(tree)
+    paths = sorted(file_path for file_path, _ in walk_files("."))
+    assert paths == sorted(str(path.relative_to(tree)) for path in tree.rglob("*") if path.is_file())
+
+def _expected_hashes(tree):
+    return {str(path): hashlib.sha512(path.read_bytes()).hexdigest() for path in tree.rglob("*") if path.is_file()}
+
+@pytest.mark.parametrize("pool", ["thread", "process"])
+def test_pools_hash_every_file(tree, pool):
+    hashes = {file_path: file_hash for file_path, file_hash, *_ in iter_hashes(str(tree), workers=3, pool=pool, progress=False)}
+    assert hashes == _expected_hashes(tree)
+
+@pytest.mark.parametrize("backend", sorted(psScannerV1.IO_BACKENDS))
+def test_backends_agree(tree, backend):
+    (tree / "empty").write_bytes(b"")
+    (tree / "large").write_bytes(os.urandom(100000))
+    # A tiny chunk size makes every backend loop and lets mmap map even the small files
+    hashes = {file_path: file_hash for file_path, file_hash, *_ in
+              iter_hashes(str(tree), backend=backend, chunk_size=7, progress=False)}
+    assert hashes == _expected_hashes(tree)
+
+def test_non_resident_ranges():
+    assert non_resident_ranges(bytes([1, 0, 0, 1, 3, 0])) == [(1, 2), (5, 1)]
+    assert non_resident_ranges(bytes([1, 1])) == []
+
+@pytest.mark.parametrize("batch_size", [10000, 1])
+def test_hardlinks_are_read_once(tree, monkeypatch, batch_size):
+    # With one file per batch, links are only found again through the cache of linked inodes
+    monkeypatch.setattr(psScannerV1, "SCHEDULE_BATCH_SIZE", batch_size)
+    os.link(tree / "d0" / "e0" / "f0", tree / "d1" / "link1")
+    os.link(tree / "d0" / "e0" / "f0", tree / "d2" / "link2")
+    stats = {}
+    hashes = {file_path: file_hash for file_path, file_hash, *_ in iter_hashes(str(tree), stats=stats, progress=False)}
+    assert hashes == _expected_hashes(tree)
+    assert (stats["hashed_files"], stats["shared_files"]) == (43, 2)
+
+def test_evicted_hardlinks_are_hashed_again(tree, monkeypatch):
+    monkeypatch.setattr(psScannerV1, "SCHEDULE_BATCH_SIZE", 1)
+    monkeypatch.setattr(psScannerV1, "LINKED_INODES", 0)
+    os.link(tree / "d0" / "e0" / "f0", tree / "d1" / "link1")
+    stats = {}
+    hashes = {file_path: file_hash for file_path, file_hash, *_ in iter_hashes(str(tree), stats=stats, progress=False)}
+    assert hashes == _expected_hashes(tree)
+    assert (stats["hashed_files"], stats["shared_files"]) == (44, 0)
+
+def test_spilled_runs_are_merged_in_order(tmp_path, monkeypatch):
+    monkeypatch.setattr(psScannerV1, "SORT_RUN_SIZE", 3)
+    hashes = {f"file{index:02}": f"{index:0128x}" for index in reversed(range(10))}
+    output_file = tmp_path / "manifest.txt"
+    assert save_hashes_to_file(hashes, str(output_file)) == 10
+    assert output_file.read_text() == "".join(f"{file_hash}:{file_path}\n" for file_path, file_hash in sorted(hashes.items()))
+    assert os.listdir(tmp_path) == ["manifest.txt"]
+
+def test_interrupted_save_leaves_no_runs(tmp_path, monkeypatch):
+    monkeypatch.setattr(psScannerV1, "SORT_RUN_SIZE", 2)
+
+    def interrupted():
+        for index in range(10):
+            yield f"file{index}", "a" * 128, (1, 2, 3, index), "b" * 16
+        raise KeyboardInterrupt
+
+    output_file = tmp_path / "manifest.txt"
+    with pytest.raises(KeyboardInterrupt):
+        save_hashes_to_file(interrupted(), str(output_file), str(output_file) + ".meta",
+                            fast_file=str(output_file) + ".fast", fast_algorithm="sha256")
+    assert os.listdir(tmp_path) == []
+
+def _scan(tree, output_file, shard=None):
+    hashes = iter_hashes(str(tree), progress=False, shard=shard)
+    return save_hashes_to_file(hashes, str(output_file), str(output_file) + ".meta")
+
+def _rescan(tree, manifest_file, **options):
+    stats = {}
+    hashes = {file_path: file_hash for file_path, file_hash, *_ in
+              iter_hashes(str(tree), cache=load_hash_cache(str(manifest_file)), stats=stats, progress=False, **options)}
+    return hashes, stats
+
+def test_reuse_skips_unchanged_files(tree, tmp_path):
+    manifest_file = tmp_path / "scan.txt"
+    _scan(tree, manifest_file)
+    (tree / "d1" / "e2" / "f5").write_text("changed")
+
+    hashes, stats = _rescan(tree, manifest_file)
+    assert hashes == _expected_hashes(tree)
+    assert (stats["reused_files"], stats["hashed_files"]) == (42, 1)
+
+def test_paranoid_rehashes_unchanged_files(tree, tmp_path):
+    manifest_file = tmp_path / "scan.txt"
+    _scan(tree, manifest_file)
+    hashes, stats = _rescan(tree, manifest_file, paranoid=1.0)
+    assert hashes == _expected_hashes(tree)
+    assert (stats["reused_files"], stats["hashed_files"]) == (0, 43)
+
+def test_fast_hash_reuses_touched_files(tree, tmp_path):
+    manifest_file = tmp_path / "scan.txt"
+    hashes = iter_hashes(str(tree), fast_algorithm="sha256", progress=False)
+    save_hashes_to_file(hashes, str(manifest_file), str(manifest_file) + ".meta",
+                        fast_file=str(manifest_file) + ".fast", fast_algorithm="sha256")
+    touched = tree / "d0" / "e0" / "f0"
+    os.utime(touched, ns=(0, 0))
+    (tree / "d1" / "e1" / "f1").write_text("content X")
+
+    stats = {}
+    cache = load_hash_cache(str(manifest_file), fast_algorithm="sha256")
+    hashes = {file_path: file_hash for file_path, file_hash, *_ in
+              iter_hashes(str(tree), cache=cache, stats=stats, fast_algorithm="sha256", progress=False)}
+    assert hashes == _expected_hashes(tree)
+    assert (stats["reused_files"], stats["fast_reused_files"], stats["hashed_files"]) == (41, 1, 2)
+
+def test_parse_shard():
+    assert parse_shard("2/4") == (1, 4)
+    for text in ("0/4", "5/4", "2", "a/b"):
+        with pytest.raises(ValueError):
+            parse_shard(text)
+
+def test_merge_of_shards_equals_single_scan(tree, tmp_path):
+    single_file = tmp_path / "single.txt"
+    _scan(tree, single_file)
+    shard_files = []
+    for index in range(3):
+        shard_file = tmp_path / f"shard{index}.txt"
+        _scan(tree, shard_file, shard=(index, 3))
+        shard_files.append(str(shard_file))
+
+    merged_file = tmp_path / "merged.txt"
+    merge_shards(shard_files, str(merged_file))
+
+    assert merged_file.read_bytes() == single_file.read_bytes()
+    assert (tmp_path / "merged.txt.meta").read_bytes() == (tmp_path / "single.txt.meta").read_bytes()
+
+def test_load_checkpoint_ignores_truncated_last_line(tmp_path):
+    checkpoint_file = tmp_path / "scan.checkpoint"
+    entries = [(f"dir/file{index}", f"{index:0128x}", (index, 1, 2, 3), None) for index in range(3)]
+    list(checkpoint_hashes(iter(entries), str(checkpoint_file)))
+    with open(checkpoint_file, 'a') as f:
+        f.write(f"9:1:2:3:{'f' * 64}")
+
+    cache = load_checkpoint(str(checkpoint_file))
+    assert cache == {file_path: (signature, file_hash, None) for file_path, file_hash, signature, _ in entries}
+
+def test_load_checkpoint_of_other_algorithm_starts_over(tmp_path):
+    checkpoint_file = tmp_path / "scan.checkpoint"
+    checkpoint_file.write_text(f"{CHECKPOINT_HEADER}sha256:\n1:2:3:4:{'a' * 64}::file\n")
+    assert load_checkpoint(str(checkpoint_file)) == {}
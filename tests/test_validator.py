@@ -0,0 +1,161 @@
+import os
+import csv
+import json
+
+import pytest
+from typer.testing import CliRunner
+
+import psManifestV1
+import psValidatorV1
+
+from psScannerV1 import iter_hashes, save_hashes_to_file
+from psValidatorV1 import EXIT_DIFFERENCES, EXIT_ERROR, EXIT_MATCH, Report, app, compare_hashes, verify_tree
+
+class RecordingReport(Report):
+    """Keeps the deviations and summary it is given."""
+
+    def __init__(self):
+        super().__init__()
+        self.entries = []
+        self.counts = None
+
+    def entry(self, status, file_path, old_hash, new_hash):
+        self.entries.append((status, file_path, old_hash, new_hash))
+
+    def summary(self, counts, skipped_directories=None):
+        self.counts = counts
+
+def _compare(old_file, new_file, **options):
+    report = RecordingReport()
+    counts = compare_hashes(str(old_file), str(new_file), report=report, quiet=True, **options)
+    return counts, sorted(report.entries)
+
+@pytest.fixture
+def manifests(tree, tmp_path):
+    """An old and a new text and binary manifest of the tree, with one file changed, removed and added."""
+    def scan(name):
+        for output_format, extension in (("text", ".txt"), ("binary", ".psm")):
+            output_file = str(tmp_path / (name + extension))
+            save_hashes_to_file(iter_hashes(str(tree), progress=False), output_file, output_format=output_format,
+                                merkle_file=output_file + ".merkle")
+
+    scan("old")
+    (tree / "d1" / "e2" / "f5").write_text("changed")
+    (tree / "d3" / "e0" / "f3").unlink()
+    (tree / "d2" / "added").write_text("added")
+    scan("new")
+    return tmp_path
+
+@pytest.mark.parametrize("extension", [".txt", ".psm"])
+def test_stream_and_dict_agree(manifests, extension):
+    old_file, new_file = manifests / ("old" + extension), manifests / ("new" + extension)
+    stream = _compare(old_file, new_file, mode="stream", merkle=False)
+    dictionary = _compare(old_file, new_file, mode="dict", merkle=False)
+    assert stream == dictionary
+    assert stream[0] == {"match": 41, "mismatch": 1, "unique_to_old": 1, "unique_to_new": 1}
+
+def test_stream_mode_refuses_unsorted_files(tmp_path):
+    file_hash = "a" * 128
+    old_file = tmp_path / "old.txt"
+    old_file.write_text(f"{file_hash}:z\n{file_hash}:b\n")
+    assert compare_hashes(str(old_file), str(old_file), mode="stream", report=RecordingReport(), quiet=True) is None
+
+def test_manifests_of_different_algorithms_are_not_compared(tree, tmp_path):
+    for algorithm in ("sha512", "sha256"):
+        save_hashes_to_file(iter_hashes(str(tree), algorithm=algorithm, progress=False), str(tmp_path / f"{algorithm}.txt"),
+                            algorithm=algorithm)
+    assert _compare(tmp_path / "sha512.txt", tmp_path / "sha256.txt") == (None, [])
+
+@pytest.mark.parametrize("mode", ["auto", "stream", "dict"])
+def test_undecodable_file_is_an_error(tmp_path, monkeypatch, mode):
+    monkeypatch.setattr(psValidatorV1, "ENCODING", "utf-8")
+    old_file = tmp_path / "old.txt"
+    old_file.write_bytes(b"a" * 128 + b":b\xff\n")
+    assert compare_hashes(str(old_file), str(old_file), mode=mode, report=RecordingReport(), quiet=True) is None
+
+def test_auto_mode_reports_nothing_from_unsorted_stream(tmp_path):
+    file_hash = "a" * 128
+    old_file = tmp_path / "old.txt"
+    new_file = tmp_path / "new.txt"
+    old_file.write_text(f"{file_hash}:z\n{file_hash}:b\n{file_hash}:c\n")
+    new_file.write_text(f"{file_hash}:b\n{file_hash}:c\n{file_hash}:z\n")
+    counts, entries = _compare(old_file, new_file)
+    assert counts == {"match": 3, "mismatch": 0, "unique_to_old": 0, "unique_to_new": 0}
+    assert entries == []
+
+@pytest.mark.parametrize("extension", [".txt", ".psm"])
+def test_merkle_reports_the_same_deviations(manifests, extension):
+    old_file, new_file = manifests / ("old" + extension), manifests / ("new" + extension)
+    assert _compare(old_file, new_file)[1] == _compare(old_file, new_file, merkle=False)[1]
+
+def test_matching_merkle_roots_count_every_file(manifests):
+    counts, entries = _compare(manifests / "old.psm", manifests / "old.txt")
+    assert counts == {"match": 43, "mismatch": 0, "unique_to_old": 0, "unique_to_new": 0}
+    assert entries == []
+
+def test_stale_merkle_sidecar_is_ignored(manifests):
+    (manifests / "old.txt").write_bytes((manifests / "new.txt").read_bytes())
+    counts, _ = _compare(manifests / "old.txt", manifests / "old.psm")
+    assert counts["mismatch"] == 1
+
+def test_unchanged_manifests_are_not_hashed_again(manifests, monkeypatch):
+    def manifest_digest(file_path):
+        raise AssertionError(f"{file_path} was hashed")
+
+    monkeypatch.setattr(psManifestV1, "manifest_digest", manifest_digest)
+    counts, _ = _compare(manifests / "old.psm", manifests / "old.txt")
+    assert counts["match"] == 43
+
+def test_copied_manifest_keeps_its_sidecar(manifests):
+    old_file = manifests / "old.txt"
+    stat_result = old_file.stat()
+    os.utime(old_file, ns=(stat_result.st_atime_ns, stat_result.st_mtime_ns + 10 ** 9))
+    counts, entries = _compare(old_file, manifests / "old.psm")
+    assert counts["match"] == 43
+    assert entries == []
+
+@pytest.mark.parametrize("extension", [".txt", ".psm"])
+def test_verify_matches_comparing_a_new_scan(manifests, tree, extension):
+    report = RecordingReport()
+    counts = verify_tree(str(manifests / ("old" + extension)), str(tree), report=report, progress=False)
+    assert (counts, sorted(report.entries)) == _compare(manifests / "old.txt", manifests / "new.txt", merkle=False)
+
+def test_verify_fail_fast_stops_at_the_first_deviation(manifests, tree):
+    report = RecordingReport()
+    counts = verify_tree(str(manifests / "old.txt"), str(tree), fail_fast=True, report=report, progress=False)
+    assert counts["mismatch"] + counts["unique_to_old"] + counts["unique_to_new"] == 1
+    assert len(report.entries) == 1
+
+def _run(*args):
+    return CliRunner().invoke(app, list(args))
+
+@pytest.mark.parametrize("old_name, new_name, exit_code", [
+    ("old.txt", "old.psm", EXIT_MATCH), ("old.txt", "new.txt", EXIT_DIFFERENCES), ("old.txt", "missing.txt", EXIT_ERROR)])
+def test_compare_exit_codes(manifests, old_name, new_name, exit_code):
+    result = _run("compare", "-q", "-o", str(manifests / old_name), "-n", str(manifests / new_name))
+    assert result.exit_code == exit_code
+    assert result.stdout == ""
+
+def test_jsonl_report_on_stdout(manifests):
+    result = _run("compare", "--no-merkle", "--report", "jsonl", "-o", str(manifests / "old.txt"), "-n", str(manifests / "new.psm"))
+    assert result.exit_code == EXIT_DIFFERENCES
+    records = [json.loads(line) for line in result.stdout.splitlines()]
+    assert sorted(record["status"] for record in records) == ["mismatch", "summary", "unique_to_new", "unique_to_old"]
+    assert records[-1] == {"status": "summary", "match": 41, "mismatch": 1, "unique_to_old": 1, "unique_to_new": 1}
+
+def test_csv_report_file(manifests, tree):
+    report_file = manifests / "report.csv"
+    result = _run("verify", "-q", "--report", "csv", "--report-file", str(report_file),
+                  "-b", str(manifests / "old.txt"), "-i", str(tree))
+    assert result.exit_code == EXIT_DIFFERENCES
+    with open(report_file, newline="") as f:
+        rows = list(csv.DictReader(f))
+    assert sorted((row["status"], row["path"]) for row in rows) == [
+        ("mismatch", str(tree / "d1" / "e2" / "f5")), ("unique_to_new", str(tree / "d2" / "added")),
+        ("unique_to_old", str(tree / "d3" / "e0" / "f3"))]
+
+def test_unwritable_report_file_is_an_error(manifests):
+    result = _run("compare", "--report", "jsonl", "--report-file", str(manifests / "missing" / "report.jsonl"),
+                  "-o", str(manifests / "old.txt"), "-n", str(manifests / "new.txt"))
+    assert result.exit_code == EXIT_ERROR
+    assert "Cannot write report file" in result.stderr
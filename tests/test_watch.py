@@ -0,0 +1,73 @@
+import sys
+import shutil
+import hashlib
+
+import pytest
+
+from psScannerV1 import TreeWatcher
+
+pytestmark = pytest.mark.skipif(not sys.platform.startswith("linux"), reason="watch relies on Linux inotify")
+
+@pytest.fixture
+def watcher(tree):
+    watcher = TreeWatcher(str(tree), {"workers": 1})
+    watcher.watch_subtree(watcher.root)
+    watcher.rescan(watcher.root)
+    yield watcher
+    watcher.inotify.close()
+
+def _settle(watcher):
+    watcher.apply(*watcher.collect(0.2, 2.0))
+
+def _hash(path):
+    return hashlib.sha512(path.read_bytes()).hexdigest()
+
+def test_events_update_the_live_map(watcher, tree):
+    changed, removed = tree / "d1" / "e2" / "f5", tree / "d3" / "e0" / "f3"
+    changed.write_text("changed")
+    removed.unlink()
+    (tree / "d2" / "added").write_text("added")
+    _settle(watcher)
+
+    assert watcher.entries[str(changed)][1] == _hash(changed)
+    assert str(removed) not in watcher.entries
+    assert watcher.entries[str(tree / "d2" / "added")][1] == _hash(tree / "d2" / "added")
+    assert len(watcher.entries) == 43
+
+def test_removed_directory_drops_its_files(watcher, tree):
+    shutil.rmtree(tree / "d0")
+    _settle(watcher)
+    assert not [path for path in watcher.entries if path.startswith(str(tree / "d0") + "/")]
+    assert str(tree / "d0-x") in watcher.entries and str(tree / "d0.txt") in watcher.entries
+
+def test_deviations_from_the_baseline_are_reported(tree):
+    baseline = {str(path): _hash(path) for path in tree.rglob("*") if path.is_file()}
+    deviations = []
+    watcher = TreeWatcher(str(tree), {"workers": 1}, baseline.get, on_deviation=lambda *deviation: deviations.append(deviation))
+    try:
+        watcher.watch_subtree(watcher.root)
+        watcher.rescan(watcher.root)
+        watcher.check_missing(baseline.items())
+        assert deviations == []
+
+        changed, removed = tree / "d1" / "e2" / "f5", tree / "d3" / "e0" / "f3"
+        changed.write_text("changed")
+        removed.unlink()
+        _settle(watcher)
+    finally:
+        watcher.inotify.close()
+    assert sorted(deviations) == sorted([(str(changed), baseline[str(changed)], _hash(changed)),
+                                         (str(removed), baseline[str(removed)], None)])
+
+def test_overflow_watches_directories_created_meanwhile(watcher, tree):
+    new_directory = tree / "created" / "nested"
+    new_directory.mkdir(parents=True)
+    (new_directory / "early").write_text("early")
+    watcher.inotify.read_events(0.2)
+    watcher.apply(set(), set(), set(), True)
+
+    assert str(new_directory) in watcher.inotify.directories.values()
+    assert str(new_directory / "early") in watcher.entries
+    (new_directory / "late").write_text("late")
+    _settle(watcher)
+    assert str(new_directory / "late") in watcher.entries